@@ -0,0 +1,509 @@
+from __future__ import print_function
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+
+class Benchmark:
+    '''
+    measure throughput of pipeline stages on synthetic data (same shape as our crawl/labelled files)
+    input:
+        1. number of synthetic rows
+        2. list of benchmark names to run (method names of this class)
+    output:
+        1. log with rows/sec of the current implementation (and of the old implementation when relevant)
+    '''
+
+    def __init__(self, num_rows, seed=0):
+
+        self.num_rows = num_rows                        # synthetic frame size
+        self.seed = seed
+        self.random_state = np.random.RandomState(seed)
+        self.verbose_flag = True
+
+        from time import gmtime, strftime
+        self.cur_time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
+
+    # init log file
+    def init_debug_log(self):
+        import logging
+
+        lod_dir = './log/benchmark/'
+        log_file_name = str(self.cur_time) + '.log'
+        import os
+        if not os.path.exists(lod_dir):
+            os.makedirs(lod_dir)
+
+        logging.basicConfig(filename=lod_dir + log_file_name,
+                            format='%(asctime)s, %(levelname)s %(message)s',
+                            datefmt='%H:%M:%S',
+                            level=logging.DEBUG)
+
+        # print result in addition to log file
+        if self.verbose_flag:
+            stderrLogger = logging.StreamHandler()
+            stderrLogger.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+            logging.getLogger().addHandler(stderrLogger)
+
+        logging.info("")
+        return
+
+    ########################################## synthetic data ##########################################
+
+    def _synthetic_review_df(self, num_rows):
+        """
+        labelled review frame with the columns of 25K_amazon_<vertical>.csv
+        review length 0-60 tokens, ~2% missing reviews
+        """
+        vocabulary = np.array(['word' + str(i) for i in range(5000)])
+        review_length = self.random_state.randint(0, 60, size=num_rows)
+        token_ids = self.random_state.randint(0, len(vocabulary), size=review_length.sum())
+
+        review_list = list()
+        start = 0
+        for length in review_length:
+            review_list.append(' '.join(vocabulary[token_ids[start:start + length]]))
+            start += length
+
+        review_series = pd.Series(review_list, dtype=object)
+        review_series[self.random_state.rand(num_rows) < 0.02] = np.nan
+
+        # ~30% bad reviews with a reason (raw reasons as written by the taggers)
+        reason_list = np.array([
+            'Subjective sentence', 'Missing context', 'Refers to a specific listing aspect',
+            'Non-informative sentence ', 'Non-informative sentence', 'poor language (spelling mistakes)',
+            'Purely negative sentence', 'Expresses explicit doubt', 'Refers to the description', 'Too detailed',
+            'Other (please explain in comments column)', 'Offensive language', 'too specific/narrow'
+        ], dtype=object)
+        bad_review = self.random_state.rand(num_rows) < 0.3
+        reason_series = pd.Series(reason_list[self.random_state.randint(0, len(reason_list), size=num_rows)])
+        reason_series[~bad_review] = np.nan
+
+        return pd.DataFrame({
+            'Review': review_series,
+            'Tagging': np.where(bad_review, 'Bad', 'Good'),
+            'Reason': reason_series
+        })
+
+    ########################################## benchmarks ##########################################
+
+    def review_analysis(self, legacy_rows=50000):
+        """
+        CleanData review length + statistics, vectorized vs. the old iterrows loop (on a sample)
+        """
+        from preprocessing import CleanData
+
+        logging.info('')
+        logging.info('benchmark: review analysis, rows: ' + str(self.num_rows))
+        df = self._synthetic_review_df(self.num_rows)
+
+        start_time = time.time()
+        review_length = CleanData._calculate_review_length(df['Review'])
+        review_length = review_length[review_length != 0]
+        review_statistic_dict = CleanData._review_length_statistic(review_length.values)
+        self._log_throughput('review analysis vectorized', df.shape[0], time.time() - start_time)
+        logging.info('statistic: ' + str(review_statistic_dict))
+
+        sample_df = df.iloc[:legacy_rows].copy()
+        start_time = time.time()
+        legacy_review_length = self._legacy_review_length(sample_df)
+        self._log_throughput('review analysis iterrows', sample_df.shape[0], time.time() - start_time)
+
+        identical = legacy_review_length.equals(CleanData._calculate_review_length(sample_df['Review']))
+        logging.info('identical review length on sample: ' + str(identical))
+        return
+
+    def label_derivation(self, num_rows_list=(25000, 250000, 2500000), legacy_rows=25000):
+        """
+        CleanData label columns (review_tag, failure_reason, one vs. all columns) for growing frame sizes
+        """
+        from preprocessing import CleanData
+
+        logging.info('')
+        logging.info('benchmark: label derivation')
+        for num_rows in num_rows_list:
+            df = self._synthetic_review_df(num_rows)
+            start_time = time.time()
+            CleanData._add_label_columns(df)
+            self._log_throughput('label derivation vectorized', num_rows, time.time() - start_time)
+
+        sample_df = df.iloc[:legacy_rows].copy()
+        start_time = time.time()
+        legacy_failure_reason = self._legacy_failure_reason(sample_df)
+        self._log_throughput('label derivation iterrows', sample_df.shape[0], time.time() - start_time)
+
+        identical = np.array_equal(legacy_failure_reason.values, df['failure_reason'].values[:legacy_rows])
+        logging.info('identical failure reason on sample: ' + str(identical))
+        return
+
+    def dtype_memory(self):
+        """
+        deep memory usage of the clean frame with default dtypes vs. the shared dtype policy
+        """
+        from preprocessing import CleanData
+        from dtype_policy import apply_dtype_policy, memory_usage_mb
+
+        logging.info('')
+        logging.info('benchmark: clean df memory, rows: ' + str(self.num_rows))
+        df = self._synthetic_review_df(self.num_rows)
+        df['review_length'] = CleanData._calculate_review_length(df['Review'])
+        CleanData._add_label_columns(df)
+
+        label_columns = ['Tagging', 'Reason', 'review_tag', 'subjective_sentence', 'missing_context',
+                         'Refers to a specific listing aspect', 'Non-informative sentence', 'failure_reason']
+        memory_before = memory_usage_mb(df[label_columns])
+        apply_dtype_policy(df)
+        logging.info('label columns memory usage (deep): ' + str(memory_before) + ' MB -> ' +
+                     str(memory_usage_mb(df[label_columns])) + ' MB')
+        return
+
+    def near_duplicate(self, duplicate_fraction=0.01):
+        """
+        MinHash/LSH near-duplicate clusters, synthetic frame with injected near-duplicates (one token changed)
+        """
+        from near_duplicate import NearDuplicateDetector, cluster_statistic
+
+        logging.info('')
+        logging.info('benchmark: near duplicate, rows: ' + str(self.num_rows))
+        df = self._synthetic_review_df(self.num_rows)
+        review_values = df['Review'].values
+
+        # copy a random long review into a random position and change its last token
+        num_duplicates = int(self.num_rows * duplicate_fraction)
+        source_idx = self.random_state.randint(0, self.num_rows, size=num_duplicates)
+        target_idx = self.random_state.randint(0, self.num_rows, size=num_duplicates)
+        for source, target in zip(source_idx, target_idx):
+            if isinstance(review_values[source], basestring) and review_values[source].count(' ') >= 30:
+                review_values[target] = review_values[source].rsplit(' ', 1)[0] + ' changed'
+
+        start_time = time.time()
+        cluster_id = NearDuplicateDetector().find_clusters(df['Review'])
+        self._log_throughput('near duplicate minhash/lsh', df.shape[0], time.time() - start_time)
+        logging.info('cluster statistic: ' + str(cluster_statistic(cluster_id)))
+        return
+
+    def word2vec_corpus_memory(self, num_reviews=712904, epoch=1):
+        """
+        peak RSS of word2vec training - token lists of all reviews in memory vs. the streaming ReviewCorpus
+        every mode runs in a fresh process (ru_maxrss is a per-process high water mark)
+        """
+        import multiprocessing
+
+        logging.info('')
+        logging.info('benchmark: word2vec corpus memory, reviews: ' + str(num_reviews) + ', epoch: ' + str(epoch))
+        for corpus_mode in ['list', 'stream']:
+            pool = multiprocessing.Pool(processes=1, maxtasksperchild=1)
+            try:
+                result_dict = pool.apply(_word2vec_peak_rss, ((corpus_mode, num_reviews, epoch, self.seed),))
+            finally:
+                pool.close()
+                pool.join()
+
+            logging.info('corpus: ' + corpus_mode +
+                         ', rss after reviews load: ' + str(result_dict['load_rss_mb']) + ' MB' +
+                         ', peak rss: ' + str(result_dict['peak_rss_mb']) + ' MB' +
+                         ', train time: ' + str(result_dict['train_time']) + ' sec' +
+                         ', vocabulary: ' + str(result_dict['vocabulary_size']))
+        return
+
+    def corpus_preparation(self, num_reviews=200000, workers_list=None, chunk_size=10000):
+        """
+        word2vec corpus preparation - single pass crawl parsing vs. the old per-review loop,
+        tokenization throughput from 1 to N processes
+        """
+        import multiprocessing
+        from train_word2vec import parallel_chunk_map, parse_crawl_reviews, _tokenize_review_chunk
+
+        if workers_list is None:
+            # 1, 2, 4, ... and all cores
+            workers_list = sorted(set([2 ** i for i in range(8) if 2 ** i <= multiprocessing.cpu_count()] +
+                                      [multiprocessing.cpu_count()]))
+
+        logging.info('')
+        logging.info('benchmark: corpus preparation, reviews: ' + str(num_reviews) + ', workers: ' + str(workers_list))
+        crawl_review_series = pd.Series(['{REVIEW=[' + review + ']}' for review in
+                                         _synthetic_review_text_list(num_reviews, self.random_state)])
+        crawl_review_series[self.random_state.rand(num_reviews) < 0.01] = np.nan
+
+        start_time = time.time()
+        review_list, rejected_amount = parse_crawl_reviews(crawl_review_series)
+        self._log_throughput('parse single pass', num_reviews, time.time() - start_time)
+
+        start_time = time.time()
+        legacy_review_list = self._legacy_parse_crawl_reviews(crawl_review_series.copy())
+        self._log_throughput('parse per review', num_reviews, time.time() - start_time)
+        logging.info('identical parsed reviews: ' + str(review_list == legacy_review_list) +
+                     ', rejected reviews: ' + str(rejected_amount))
+
+        for num_workers in workers_list:
+            start_time = time.time()
+            num_tokens = 0
+            for token_list_chunk in parallel_chunk_map(_tokenize_review_chunk, review_list, num_workers, chunk_size):
+                num_tokens += sum(len(token_list) for token_list in token_list_chunk)
+            self._log_throughput('tokenize, workers: ' + str(num_workers), len(review_list),
+                                 time.time() - start_time)
+        return
+
+    def word2vec_corpus_file(self, num_reviews=712904, workers_list=(10, 20, 40), epoch=1):
+        """
+        word2vec training wall time - in memory token lists (python iterable) vs. line corpus file (corpus_file mode)
+        """
+        import os
+        import shutil
+        import tempfile
+        import gensim
+        from train_word2vec import TrainWord2Vec, write_line_sentence_corpus
+
+        logging.info('')
+        logging.info('benchmark: word2vec corpus file, reviews: ' + str(num_reviews) + ', epoch: ' + str(epoch) +
+                     ', workers: ' + str(list(workers_list)))
+        review_list = _synthetic_review_text_list(num_reviews, self.random_state)
+        documents = [gensim.utils.simple_preprocess(line) for line in review_list]
+
+        corpus_dir = tempfile.mkdtemp()
+        try:
+            corpus_path = os.path.join(corpus_dir, str(num_reviews) + '_corpus.txt')
+            write_line_sentence_corpus(review_list, corpus_path)
+
+            for num_workers in workers_list:
+                train_obj = TrainWord2Vec(None, 'benchmark', None, {'embedding_size': 100, 'window': 10,
+                                                                    'epoch': epoch, 'workers': num_workers})
+                start_time = time.time()
+                train_obj._train_model(documents)
+                self._log_throughput('word2vec list, workers: ' + str(num_workers), num_reviews,
+                                     time.time() - start_time)
+
+                start_time = time.time()
+                train_obj._train_model_corpus_file(corpus_path)
+                self._log_throughput('word2vec corpus_file, workers: ' + str(num_workers), num_reviews,
+                                     time.time() - start_time)
+        finally:
+            shutil.rmtree(corpus_dir)
+        return
+
+    def embedding_matrix(self, vocabulary_size_list=(50000, 200000), store_size=400000, embedding_size=100,
+                         missing_fraction=0.2):
+        """
+        pre-trained embedding matrix of a tokenizer word_index - python loop into float64 (old implementation) vs.
+        one vectorized float32 gather, and the process cache hit of a repeated word_index (next grid configuration)
+        """
+        import os
+        import shutil
+        import tempfile
+        import embedding_store
+        from embedding_store import save_vectors, load_vectors
+
+        logging.info('')
+        logging.info('benchmark: embedding matrix, store words: ' + str(store_size) + ', embedding size: ' +
+                     str(embedding_size) + ', vocabulary sizes: ' + str(list(vocabulary_size_list)))
+
+        store_dir = tempfile.mkdtemp()
+        try:
+            prefix = os.path.join(store_dir, 'benchmark')
+            save_vectors(prefix, ['w' + str(i) for i in range(store_size)],
+                         self.random_state.standard_normal((store_size, embedding_size)).astype(np.float32))
+            vector_store = load_vectors(prefix, mmap_mode='r')
+
+            for vocabulary_size in vocabulary_size_list:
+                # tokenizer words - pre-trained words in random order + words missing in the store
+                num_missing = int(vocabulary_size * missing_fraction)
+                word_list = ['w' + str(i) for i in self.random_state.permutation(store_size)[
+                                                   :vocabulary_size - num_missing]] + \
+                            ['oov' + str(i) for i in range(num_missing)]
+                word_index = dict(zip(word_list, self.random_state.permutation(vocabulary_size) + 1))
+
+                start_time = time.time()
+                legacy_matrix = self._legacy_embedding_matrix(vector_store, word_index, embedding_size)
+                legacy_time = time.time() - start_time
+
+                embedding_store._embedding_matrix_cache.clear()
+                start_time = time.time()
+                matrix, num_missing_found = vector_store.embedding_matrix(word_index, embedding_size)
+                vectorized_time = time.time() - start_time
+
+                start_time = time.time()
+                vector_store.embedding_matrix(word_index, embedding_size)
+                cache_time = time.time() - start_time
+
+                logging.info('vocabulary: ' + str(vocabulary_size) + ', missing: ' + str(num_missing_found) +
+                             ', equal to old: ' + str(np.array_equal(matrix, legacy_matrix.astype(np.float32))))
+                logging.info('old (loop, float64): ' + str(round(legacy_time, 3)) + ' sec, ' +
+                             str(round(legacy_matrix.nbytes / float(1024 ** 2), 1)) + ' MB')
+                logging.info('vectorized (float32): ' + str(round(vectorized_time, 3)) + ' sec, ' +
+                             str(round(matrix.nbytes / float(1024 ** 2), 1)) + ' MB, speedup: ' +
+                             str(round(legacy_time / max(vectorized_time, 1e-9), 1)) + 'x')
+                logging.info('process cache hit: ' + str(round(cache_time, 3)) + ' sec')
+        finally:
+            embedding_store._embedding_matrix_cache.clear()
+            shutil.rmtree(store_dir)
+        return
+
+    @staticmethod
+    def _legacy_embedding_matrix(vector_store, word_index, embedding_size):
+        """ embedding matrix as built before vectorization (used as baseline) """
+        embedding_matrix = np.zeros((len(word_index) + 1, embedding_size))
+        for word, i in word_index.items():
+            if word in vector_store:
+                embedding_matrix[i] = vector_store.get_vector(word)
+        return embedding_matrix
+
+    @staticmethod
+    def _legacy_failure_reason(df):
+        """ failure reason as calculated before vectorization (used as baseline) """
+
+        def find_class(reason):
+            return {
+                'Subjective sentence': 0,
+                'Missing context': 1,
+                'Refers to a specific listing aspect': 2,
+                'Non-informative sentence ': 3,
+                'Non-informative sentence': 3,
+                'Poor language (spelling mistakes)': 4,
+                'poor language (spelling mistakes)': 4,
+                'Purely negative sentence ': 5,
+                'Purely negative sentence': 5,
+                'Expresses explicit doubt': 6,
+                'Refers to the description': 7,
+                'refers to the description': 7,
+                'Too detailed': 8,
+                'too detailed': 8,
+                'Other (please explain in comments column)': 9,
+                'Offensive language': 10,
+                'Too specific/narrow': 11,
+                'too specific/narrow': 11
+            }[reason]
+
+        df['failure_reason'] = np.nan
+        for index, row in df.iterrows():
+            if isinstance(row['Reason'], basestring):
+                df.at[index, 'failure_reason'] = find_class(row['Reason'])
+            else:
+                df.at[index, 'failure_reason'] = 12
+        return df['failure_reason']
+
+    @staticmethod
+    def _legacy_parse_crawl_reviews(review_series):
+        """ crawl review parsing as calculated before vectorization (used as baseline, changes review_series) """
+        review_series_list = list()
+        for i, v in review_series.items():
+            try:
+                review_series[i] = review_series[i].replace("{", "")
+                review_series[i] = review_series[i].replace("}", "")
+                list_str = review_series[i].split('=')
+                review_series[i] = ''.join(list_str[1:])
+                review_series[i] = review_series[i][1:-1]
+                review_series_list.append(review_series[i])
+            except AttributeError:
+                pass
+        return review_series_list
+
+    @staticmethod
+    def _legacy_review_length(df):
+        """ review length as calculated before vectorization (used as baseline) """
+        df['review_length'] = np.nan
+        for index, row in df.iterrows():
+            if isinstance(row['Review'], basestring):
+                review_length = len(row['Review'].split(' ')) - 1.0
+            else:
+                review_length = 0
+            df.at[index, 'review_length'] = review_length
+        return df['review_length']
+
+    @staticmethod
+    def _log_throughput(name, num_rows, elapsed):
+        logging.info('{}: rows: {}, time: {} sec, rows/sec: {}'.format(
+            name,
+            num_rows,
+            round(elapsed, 3),
+            int(num_rows / max(elapsed, 1e-9))
+        ))
+
+
+def _synthetic_review_text_list(num_reviews, random_state, vocabulary_size=50000, mean_length=45):
+    """ raw review strings (crawl shape): zipf-like word frequencies, geometric review length """
+    # alphabetic words (gensim simple_preprocess drops digits), word i = i written in base 26 letters
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary_list = list()
+    for i in range(vocabulary_size):
+        word = ''
+        while True:
+            word, i = letters[i % 26] + word, i // 26
+            if i == 0:
+                break
+        vocabulary_list.append('w' + word)
+    vocabulary = np.array(vocabulary_list)
+    review_length = np.minimum(random_state.geometric(1.0 / mean_length, size=num_reviews), 1000)
+    token_ids = np.minimum(random_state.zipf(1.3, size=review_length.sum()) - 1, vocabulary_size - 1)
+
+    review_list = list()
+    start = 0
+    for length in review_length:
+        review_list.append(' '.join(vocabulary[token_ids[start:start + length]]))
+        start += length
+    return review_list
+
+
+def _max_rss_mb():
+    import sys
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux - KB, mac os - bytes
+    return round(max_rss / (1024.0 ** 2 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+# run in a pool worker (module level function - must be picklable)
+def _word2vec_peak_rss(args):
+
+    import gensim
+    from train_word2vec import TrainWord2Vec, ReviewCorpus
+
+    corpus_mode, num_reviews, epoch, seed = args
+    review_list = _synthetic_review_text_list(num_reviews, np.random.RandomState(seed))
+    load_rss_mb = _max_rss_mb()
+
+    start_time = time.time()
+    if corpus_mode == 'list':
+        # token lists of all reviews (run_word2vec before the streaming corpus)
+        documents = [gensim.utils.simple_preprocess(line) for line in review_list]
+    else:
+        documents = ReviewCorpus(review_list)
+
+    train_obj = TrainWord2Vec(None, 'benchmark', None, {'embedding_size': 100, 'window': 10, 'epoch': epoch,
+                                                        'workers': 10})
+    model = train_obj._train_model(documents)
+    if corpus_mode != 'list':
+        documents.close()
+
+    return {
+        'load_rss_mb': load_rss_mb,
+        'peak_rss_mb': _max_rss_mb(),
+        'train_time': round(time.time() - start_time, 3),
+        'vocabulary_size': len(model.wv.vocab)
+    }
+
+
+def main(num_rows, benchmark_list):
+
+    benchmark_obj = Benchmark(num_rows)
+
+    benchmark_obj.init_debug_log()                  # init log file
+    for benchmark_name in benchmark_list:
+        getattr(benchmark_obj, benchmark_name)()    # run benchmark
+
+
+if __name__ == '__main__':
+
+    num_rows = 1000000
+    benchmark_list = [
+        'review_analysis',
+        'label_derivation',
+        'dtype_memory',
+        'near_duplicate',
+        'word2vec_corpus_memory',
+        'corpus_preparation',
+        'word2vec_corpus_file',
+        'embedding_matrix'
+    ]
+
+    main(num_rows, benchmark_list)
@@ -206,6 +206,7 @@ class PredictDescriptionModelLSTM:
         self.max_auc_list = list()
 
         # LSTM parameters
+        from sequence_cache import MAX_CACHE_MB, MAX_ENTRY_AGE_DAYS
         self.max_features = network_dict['max_features']                # 20000
         self.maxlen = network_dict['maxlen']                            # 200 (item description maximum length)
         self.batch_size = network_dict['batch_size']                    # 16
@@ -218,6 +219,10 @@ class PredictDescriptionModelLSTM:
         self.max_num_words = network_dict['max_num_words']
         self.optimizer = network_dict['optimizer']
         self.patience = network_dict['patience']
+        self.tokenizer_workers = network_dict.get('tokenizer_workers', 1)    # processes of prepare_data tokenizer
+        self.sequence_cache_dir = network_dict.get('sequence_cache_dir')    # tokenized folds cache, None - no cache
+        self.sequence_cache_max_mb = network_dict.get('sequence_cache_max_mb', MAX_CACHE_MB)
+        self.sequence_cache_max_age_days = network_dict.get('sequence_cache_max_age_days', MAX_ENTRY_AGE_DAYS)
 
         self.df_configuration_dict = df_configuration_dict
         self.multi_class_configuration_dict = multi_class_configuration_dict  # dict multi-class classification data
@@ -226,6 +231,8 @@ class PredictDescriptionModelLSTM:
         self.tensor_board_dir = tensor_board_dir                        # bool - if to use tensor board
         self.embedding_pre_trained = embedding_pre_trained              # bool - if to use pre trained embedding
         self.embedding_type = embedding_type                            # dict: type(glove or gensim), path to WV
+        self.index_mode = embedding_type.get('index_mode', 'fold')      # 'fold' / 'pretrained' token ids
+        self.vector_store = None                                        # pre-trained vectors (_load_vector_store)
         self.vertical_type = vertical_type                              # vertical type
 
         # initialize global variable
@@ -293,36 +300,84 @@ class PredictDescriptionModelLSTM:
         return global_statistic_auc_dict, global_max_auc_epoch_dict, global_statistic_ap_dict, global_max_ap_epoch_dict
         # return test_score, test_accuracy
 
-    # tokenizer sentences by keras and prepare them to lstm model
+    # tokenizer sentences and prepare them to lstm model
+    # FastTokenizer - same word_index and padded sequences as keras Tokenizer + pad_sequences, ids are written
+    # directly into int32 (n, maxlen) arrays (no list of lists per review)
+    # sequence cache - fold is tokenized once for all grid configurations (same data, folds, tokenizer and maxlen),
+    # next configurations open the cached arrays memory-mapped
     def prepare_data(self):
 
-        from keras.preprocessing import text
+        import time
+        from fast_tokenizer import FastTokenizer, DEFAULT_FILTERS
+        from sequence_cache import cache_key, cache_exists, save_sequences, load_sequences, prune_cache
+        from embedding_store import word_index_hash
 
-        t = text.Tokenizer(num_words=self.max_num_words,                            # max words in tokenizer
-                           filters="!'#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n",
-                           lower=True,
-                           split=" ",
-                           char_level=False,
-                           oov_token='UNK')
-
-        # fit the tokenizer on the documents
-        t.fit_on_texts(self.x_train)
+        start_time = time.time()
+        t = FastTokenizer(num_words=self.max_num_words,                             # max words in tokenizer
+                          filters=DEFAULT_FILTERS,
+                          lower=True,
+                          split=" ",
+                          oov_token='UNK')
 
         self.logging.info('')
         self.logging.info('token properties: ')
-        self.logging.info('filter using: ' + str("!'#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n"))
+        self.logging.info('filter using: ' + str(DEFAULT_FILTERS))
         self.logging.info('OOV token: ' + str('UNK'))
-        # print tokenizer results
-        # self.logging.info('# docs: ' + str(t.document_count))
-        # self.logging.info('t word index: ' + str(t.word_index))
-        # self.logging.info('t word counts: ' + str(t.word_counts))
-        # self.logging.info('t word docs: ' + str(t.word_docs))
 
-        self.word_index = t.word_index      # will used for pre trained glove embedding
+        # 'pretrained' index mode - token id = row of the word in the padded pre-trained matrix (no fit per fold)
+        # max_num_words is rejected in this mode (check_input) - it would drop rows of the store, not rare words
+        pretrained_word_index = None
+        if self.index_mode == 'pretrained':
+            vector_store = self._load_vector_store()
+            pretrained_word_index = vector_store.padded_word_index(t.oov_token)
+
+        key = None
+        if self.sequence_cache_dir is not None:
+            key = cache_key(self.x_train, self.x_test, {
+                'num_words': t.num_words,
+                'filters': t.filters,
+                'lower': t.lower,
+                'split': t.split,
+                'oov_token': t.oov_token,
+                'maxlen': self.maxlen,
+                'index_mode': self.index_mode,
+                'vocabulary': word_index_hash(pretrained_word_index) if pretrained_word_index is not None else None
+            })
+
+        if key is not None and cache_exists(self.sequence_cache_dir, key):
+            self.word_index, self.x_train, self.x_test = load_sequences(self.sequence_cache_dir, key)
+            load_type = 'cache hit'
+        else:
+            if pretrained_word_index is not None:
+                t.word_index = pretrained_word_index
+            else:
+                # fit the tokenizer on the documents
+                t.fit_on_texts(self.x_train)
+            # print tokenizer results
+            # self.logging.info('# docs: ' + str(t.document_count))
+            # self.logging.info('t word index: ' + str(t.word_index))
+            # self.logging.info('t word counts: ' + str(t.word_counts))
+
+            self.word_index = t.word_index      # will used for pre trained glove embedding
+            self.x_train = t.texts_to_padded_sequences(self.x_train, self.maxlen, workers=self.tokenizer_workers)
+            self.x_test = t.texts_to_padded_sequences(self.x_test, self.maxlen, workers=self.tokenizer_workers)
+            load_type = 'tokenized'
+            if key is not None:
+                # pre-trained word_index is not stored per fold
+                save_sequences(self.sequence_cache_dir, key,
+                               None if pretrained_word_index is not None else self.word_index,
+                               self.x_train, self.x_test)
+                removed, cache_mb = prune_cache(self.sequence_cache_dir, self.sequence_cache_max_mb,
+                                                self.sequence_cache_max_age_days, keep_key=key)
+                load_type = 'tokenized, cache miss, cache: ' + str(cache_mb) + ' MB, pruned entries: ' + str(removed)
+
+        if pretrained_word_index is not None:
+            self.word_index = pretrained_word_index
         self.index_word_dict = dict((v, k) for k, v in self.word_index.iteritems())
-        self.x_train = t.texts_to_sequences(self.x_train)
-        self.x_test = t.texts_to_sequences(self.x_test)
-
+        self.logging.info('tokenize and pad (' + load_type + '), index mode: ' + str(self.index_mode) +
+                          ', words: ' + str(len(self.word_index)) +
+                          ', workers: ' + str(self.tokenizer_workers) + ', key: ' + str(key) +
+                          ', time: ' + str(round(time.time() - start_time, 3)) + ' sec')
         return
 
     # core function
@@ -337,27 +392,13 @@ class PredictDescriptionModelLSTM:
         self._update_folder_name()                               # change name of roc folder name
         return
 
-    # pad sentences regards to length parameter
+    # sequences are padded regards to max len input in prepare_data (FastTokenizer)
     def _padding_sentences(self):
 
-        from keras.preprocessing import sequence
-
         self.logging.info('')
         self.logging.info(str(len(self.x_train)) + ' train sequences')
         self.logging.info(str(len(self.x_test)) + ' test sequences')
 
-        self.logging.info('Pad sequences (samples x time)')
-
-        self.x_train = sequence.pad_sequences(
-            self.x_train,
-            maxlen=self.maxlen
-        )
-
-        self.x_test = sequence.pad_sequences(
-            self.x_test,
-            maxlen=self.maxlen
-        )
-
         self.logging.info('sentences shape after padding')
         self.logging.info('x_train shape: ' + str(self.x_train.shape))
         self.logging.info('x_test shape: ' + str(self.x_test.shape))
@@ -578,36 +619,16 @@ class PredictDescriptionModelLSTM:
         :return: embedding layer
         """
 
+        if self.index_mode == 'pretrained':
+            return self._add_pre_trained_index_embedding()
+
         if self.embedding_type['type'] == 'glove':
             self.logging.info('use pre-trained glove word2vec')
             # a. load pre trained glove
-            GLOVE_DIR = '../data/glove_pretrained/glove.6B'
-            glove_suffix_name = 'glove.6B.' + str(self.embedding_size) + 'd.txt'
-            import os
-            import numpy as np
-
-            embeddings_index = {}
-            f = open(os.path.join(GLOVE_DIR, glove_suffix_name))    # 'glove.6B.100d.txt'))
-            for line in f:
-                values = line.split()
-                word = values[0]
-                coefs = np.asarray(values[1:], dtype='float32')
-                embeddings_index[word] = coefs
-            f.close()
+            vector_store = self._load_vector_store()
 
-            self.logging.info('')
-            self.logging.info('Found %s word vectors.' % len(embeddings_index))
-
-            # b. compute embedding matrix
-            embedding_matrix = np.zeros((len(self.word_index) + 1, self.embedding_size))
-            cnt = 0
-            for word, i in self.word_index.items():
-                embedding_vector = embeddings_index.get(word)
-                if embedding_vector is not None:
-                    embedding_matrix[i] = embedding_vector  # words not found in embedding index will be all-zeros.
-                else:
-                    # self.logging.info('token in train missing in word2vec: ' + str(word))
-                    cnt += 1
+            # b. compute embedding matrix, words not found in embedding index will be all-zeros
+            embedding_matrix, cnt = vector_store.embedding_matrix(self.word_index, self.embedding_size)
             self.logging.info('total tokens missing: ' + str(cnt) + ' / ' + str(len(self.word_index)))
 
             # c. build embedding layer
@@ -622,16 +643,14 @@ class PredictDescriptionModelLSTM:
             self.logging.info('use pre-trained gensim word2vec')
 
             import gzip
-            import gensim
             from keras.layers import Embedding
             import numpy as np
 
             # fname = '../data/word2vec_pretrained/motors/d_300_k_712904_w_6_e_60_v_motors'
             # fname = '../data/word2vec_pretrained/fashion/d_300_k_1341062_w_6_e_70_v_fashion'
 
-            self.logging.info('load word2vec path: ' + str(self.embedding_type['path']))
-            model = gensim.models.Word2Vec.load(self.embedding_type['path'])
-            pretrained_weights = model.wv.syn0
+            vector_store = self._load_vector_store()
+            pretrained_weights = vector_store.vectors
             vocab_size, vector_dim = pretrained_weights.shape
 
             method = 3
@@ -640,11 +659,8 @@ class PredictDescriptionModelLSTM:
                 # convert the wv word vectors into a numpy matrix that is suitable for insertion
                 # into our TensorFlow and Keras models
 
-                embedding_matrix = np.zeros((len(model.wv.vocab), vector_dim))
-                for i in range(len(model.wv.vocab)):
-                    embedding_vector = model.wv[model.wv.index2word[i]]
-                    if embedding_vector is not None:
-                        embedding_matrix[i] = embedding_vector
+                embedding_matrix = np.zeros((vocab_size, vector_dim))
+                embedding_matrix[:] = pretrained_weights
 
                 embedding_layer = Embedding(input_dim=embedding_matrix.shape[0],
                                             output_dim=embedding_matrix.shape[1],
@@ -666,15 +682,7 @@ class PredictDescriptionModelLSTM:
                 # sd = 1 / np.sqrt(len(self.word_index) + 1)
                 # embedding_matrix = np.random.normal(0, scale=sd, size=(len(self.word_index) + 1, self.embedding_size))
 
-                embedding_matrix = np.zeros((len(self.word_index) + 1, self.embedding_size))
-                cnt = 0
-                for word, i in self.word_index.items():
-                    if word in model.wv:
-                        embedding_vector = model.wv[word]
-                        embedding_matrix[i] = embedding_vector
-                    else:
-                        # self.logging.info('token in train missing in word2vec: ' + str(word))
-                        cnt += 1
+                embedding_matrix, cnt = vector_store.embedding_matrix(self.word_index, self.embedding_size)
                 self.logging.info('total tokens missing: ' + str(cnt))
 
 
@@ -693,6 +701,81 @@ class PredictDescriptionModelLSTM:
         self.logging.info('create glove pre-trained embedding: ' + str(self.embedding_size))
         return embedding_layer
 
+    def _add_pre_trained_index_embedding(self):
+        """
+        'pretrained' index mode - token ids are rows of the pre-trained matrix with a padding and an oov row in front
+        (embedding_store.load_padded_vectors), the memory-mapped matrix is the layer weights - no per fold matrix
+        """
+        from keras.layers import Embedding
+        from embedding_store import load_padded_vectors
+
+        vector_store = self._load_vector_store()
+        if vector_store.prefix is None:
+            raise ValueError('pretrained index mode needs a stored embedding')
+        padded_vectors = load_padded_vectors(vector_store.prefix, mmap_mode='r')
+        if padded_vectors.shape[1] != self.embedding_size:
+            raise ValueError('embedding size ' + str(self.embedding_size) + ' does not match pre-trained vectors ' +
+                             str(padded_vectors.shape))
+
+        self.logging.info('pre-trained index embedding: ' + str(vector_store.prefix) + ', rows: ' +
+                          str(padded_vectors.shape[0]))
+        embedding_layer = Embedding(padded_vectors.shape[0],
+                                    self.embedding_size,
+                                    weights=[padded_vectors],
+                                    input_length=self.maxlen,
+                                    trainable=False)
+        return embedding_layer
+
+    def _load_vector_store(self):
+        """ pre-trained vectors of embedding_type (glove/gensim), loaded once per classifier """
+        if self.vector_store is None:
+            if self.embedding_type['type'] == 'glove':
+                self.vector_store = self._load_glove_vectors()
+            elif self.embedding_type['type'] == 'gensim':
+                self.vector_store = self._load_gensim_vectors()
+            else:
+                raise ValueError('unknown embedding type')
+        return self.vector_store
+
+    def _load_glove_vectors(self):
+        """ parsed once into a float32 matrix cache (keyed by file checksum), later loads are memory-mapped """
+        import os
+        import time
+        from embedding_store import load_glove
+
+        GLOVE_DIR = '../data/glove_pretrained/glove.6B'
+        glove_suffix_name = 'glove.6B.' + str(self.embedding_size) + 'd.txt'
+
+        start_time = time.time()
+        vector_store = load_glove(os.path.join(GLOVE_DIR, glove_suffix_name))    # 'glove.6B.100d.txt'
+
+        self.logging.info('')
+        self.logging.info('Found %s word vectors.' % len(vector_store))
+        self.logging.info('load glove time: ' + str(round(time.time() - start_time, 3)) + ' sec')
+        return vector_store
+
+    def _load_gensim_vectors(self):
+        """
+        open the vectors-only copy of the gensim model memory-mapped (milliseconds, shared page cache)
+        older models without the copy are loaded once with gensim and exported next to the model
+        """
+        import time
+        from embedding_store import store_exists, save_vectors, load_vectors
+
+        start_time = time.time()
+        word2vec_path = self.embedding_type['path']
+        if not store_exists(word2vec_path):
+            import gensim
+            self.logging.info('load word2vec path: ' + str(word2vec_path))
+            model = gensim.models.Word2Vec.load(word2vec_path)
+            save_vectors(word2vec_path, model.wv.index2word, model.wv.syn0)
+            self.logging.info('export word2vec vectors: ' + str(word2vec_path))
+
+        vector_store = load_vectors(word2vec_path, mmap_mode='r')
+        self.logging.info('open word2vec vectors (mmap): ' + str(word2vec_path) + ', words: ' +
+                          str(len(vector_store)) + ', time: ' + str(round(time.time() - start_time, 3)) + ' sec')
+        return vector_store
+
     # create tensor board dir path
     # TODO save sophisticate regards to current fold
     def _create_tensor_board_dir(self):
@@ -750,14 +833,20 @@ class PredictDescriptionModelLSTM:
                 return
 
             # plot auc score for current epoch
+            # one predict per split for all heads, loss/accuracy from the predictions (validation - keras fit logs)
             def on_epoch_end(self, epoch, logs={}):
 
+                import time
+                start_time = time.time()
+                y_pred_list = self.model.predict(self.x, batch_size=self.batch_size)
+                y_pred_val_list = self.model.predict(self.x_val, batch_size=self.batch_size)
+
                 if self.multi_class_flag:
                     for idx, class_name in enumerate(self.class_names):
-                        y_pred = self.model.predict(self.x)[idx]
+                        y_pred = y_pred_list[idx]
                         auc_train = roc_auc_score(self.y[idx], y_pred)
 
-                        y_pred_val = self.model.predict(self.x_val)[idx]
+                        y_pred_val = y_pred_val_list[idx]
                         auc_test = roc_auc_score(self.y_val[idx], y_pred_val)
 
                         avg_precision_score_train = average_precision_score(self.y[idx], y_pred)
@@ -766,19 +855,11 @@ class PredictDescriptionModelLSTM:
                         precision_train_th, recall_train_th, _ = precision_recall_curve(self.y[idx], y_pred)
                         precision_test_th, recall_test_th, _ = precision_recall_curve(self.y_val[idx], y_pred_val)
 
-                        test_metric = self.model.evaluate(
-                            self.x_val,
-                            self.y_val,
-                            batch_size=self.batch_size)
-                        test_loss = test_metric[idx + 1]
-                        test_accuracy = test_metric[idx + 1 + len(self.class_names)]
-
-                        train_metric = self.model.evaluate(
-                            self.x,
-                            self.y,
-                            batch_size=self.batch_size)
-                        train_loss = train_metric[idx + 1]
-                        train_accuracy = train_metric[idx + 1 + len(self.class_names)]
+                        output_name = self.model.output_names[idx]
+                        test_loss, test_accuracy = self._loss_accuracy(
+                            self.y_val[idx], y_pred_val, logs, 'val_' + output_name + '_loss',
+                            'val_' + output_name + '_acc')
+                        train_loss, train_accuracy = self._loss_accuracy(self.y[idx], y_pred)
 
                         self.logging.info('')
                         self.logging.info('epoch number: ' + str(epoch + 1))
@@ -824,10 +905,10 @@ class PredictDescriptionModelLSTM:
                                                                    class_name=self.class_names[idx])
 
                 else:
-                    y_pred = self.model.predict(self.x)
+                    y_pred = y_pred_list
                     auc_train = roc_auc_score(self.y, y_pred)
 
-                    y_pred_val = self.model.predict(self.x_val)
+                    y_pred_val = y_pred_val_list
                     auc_test = roc_auc_score(self.y_val, y_pred_val)
 
                     avg_precision_score_train = average_precision_score(self.y, y_pred)
@@ -836,15 +917,8 @@ class PredictDescriptionModelLSTM:
                     precision_train_th, recall_train_th, _ = precision_recall_curve(self.y, y_pred)
                     precision_test_th, recall_test_th, _ = precision_recall_curve(self.y_val, y_pred_val)
 
-                    test_loss, test_accuracy = self.model.evaluate(
-                        self.x_val,
-                        self.y_val,
-                        batch_size=self.batch_size)
-
-                    train_loss, train_accuracy = self.model.evaluate(
-                        self.x,
-                        self.y,
-                        batch_size=self.batch_size)
+                    test_loss, test_accuracy = self._loss_accuracy(self.y_val, y_pred_val, logs, 'val_loss', 'val_acc')
+                    train_loss, train_accuracy = self._loss_accuracy(self.y, y_pred)
 
                     self.logging.info('')
                     self.logging.info('epoch number: ' + str(epoch+1))
@@ -886,6 +960,8 @@ class PredictDescriptionModelLSTM:
                                                               y_positive_name=self.y_positive_name,
                                                               fold_counter=self.fold_counter)
 
+                self.logging.info('epoch evaluation time: ' + str(round(time.time() - start_time, 3)) + ' sec')
+
                 confusion_matrix_bool = False
                 if confusion_matrix_bool:
                     import itertools
@@ -902,6 +978,23 @@ class PredictDescriptionModelLSTM:
 
                 return
 
+            @staticmethod
+            def _loss_accuracy(y_true, y_pred, logs=None, loss_key=None, accuracy_key=None):
+                """
+                binary cross entropy and accuracy of sigmoid predictions (as keras evaluate - predictions clipped to
+                [1e-7, 1 - 1e-7], accuracy of rounded predictions), values of keras fit logs are used if exist
+                """
+                import numpy as np
+                if logs and loss_key in logs and accuracy_key in logs:
+                    return logs[loss_key], logs[accuracy_key]
+
+                y_true = np.asarray(y_true, dtype=np.float64).reshape(-1)
+                y_pred = np.asarray(y_pred, dtype=np.float64).reshape(-1)
+                y_clip = np.clip(y_pred, 1e-7, 1 - 1e-7)
+                loss = -np.mean(y_true * np.log(y_clip) + (1 - y_true) * np.log(1 - y_clip))
+                accuracy = np.mean(y_true == np.round(y_pred))
+                return loss, accuracy
+
             def on_batch_begin(self, batch, logs={}):
                 return
 
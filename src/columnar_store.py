@@ -0,0 +1,256 @@
+from __future__ import print_function
+import os
+import json
+import logging
+import shutil
+import numpy as np
+import pandas as pd
+
+# typed columnar copy of a data frame, written next to the csv it mirrors (<csv name>_columnar/)
+#     meta.json               - number of rows, column order, kind and dtype of every column, size and mtime of the
+#                               mirrored csv (a csv written again after the store makes the store stale)
+#     c<i>.bin                - numeric/bool column values (raw, loaded with np.memmap)
+#     c<i>.bin + c<i>.end.bin - string column utf-8 bytes + int64 end offset of every value
+#     c<i>.null.bin           - string column null mask (uint8)
+#     c<i>.bin (category)     - int32 category codes (-1 = nan), categories are kept in meta.json
+# a column can be loaded alone without parsing the others (column projection)
+
+META_FILE_NAME = 'meta.json'
+
+
+def get_store_dir(csv_file_path):
+    """ columnar store directory of a csv file, e.g. ../data/clean/clean_data_multi_new_motors_columnar/ """
+    return os.path.splitext(csv_file_path)[0] + '_columnar/'
+
+
+def store_exists(store_dir, source_path=None):
+    """
+    store is complete only after meta.json was written (ColumnarWriter.close)
+    :param source_path: mirrored csv - the store exists only if it was written from the current csv (same size and
+                        mtime as stored by ColumnarWriter.close), None - no check
+    """
+    meta_path = os.path.join(store_dir, META_FILE_NAME)
+    if not os.path.exists(meta_path):
+        return False
+    if source_path is None:
+        return True
+
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    return meta.get('source') == _source_stat(source_path)
+
+
+def _source_stat(source_path):
+    if not os.path.exists(source_path):
+        return None
+    source_stat = os.stat(source_path)
+    return {'size': source_stat.st_size, 'mtime': source_stat.st_mtime}
+
+
+class ColumnarWriter(object):
+    """
+    write a data frame into a columnar store, frame can be appended chunk by chunk (streaming mode)
+    column kind is defined by the first chunk: object -> 'string', categorical -> 'category', otherwise 'numeric'
+    a later chunk with another inferred dtype promotes the column (_promote_column), e.g. a column that is all nan
+    (float64) in the first chunk and text later becomes a 'string' column
+    categories of a category column are the union of the categories of all chunks
+    """
+
+    def __init__(self, store_dir):
+
+        self.store_dir = store_dir
+        self.meta = {
+            'num_rows': 0,
+            'columns': [],      # list of dict: name, kind, dtype, file, num_bytes (string columns)
+            'source': None      # size and mtime of the mirrored csv (close)
+        }
+
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+        os.makedirs(store_dir)
+
+    def append(self, df):
+
+        if not self.meta['columns']:
+            self._init_columns(df)
+
+        column_names = [column_dict['name'] for column_dict in self.meta['columns']]
+        if list(df.columns) != column_names:
+            raise ValueError('columnar store chunk columns miss-match: ' + str(list(df.columns)))
+
+        for column_dict in self.meta['columns']:
+            self._promote_column(column_dict, df[column_dict['name']].values)
+            if column_dict['kind'] == 'numeric':
+                self._append_numeric(column_dict, df[column_dict['name']].values)
+            elif column_dict['kind'] == 'category':
+                self._append_category(column_dict, df[column_dict['name']].values)
+            else:
+                self._append_string(column_dict, df[column_dict['name']].values)
+
+        self.meta['num_rows'] += df.shape[0]
+        return
+
+    def close(self, source_path=None):
+        """ :param source_path: mirrored csv, must be complete (its size and mtime mark the store as current) """
+        if source_path is not None:
+            self.meta['source'] = _source_stat(source_path)
+        with open(os.path.join(self.store_dir, META_FILE_NAME), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        return
+
+    def _init_columns(self, df):
+        for idx, column_name in enumerate(df.columns):
+            column_dtype = df[column_name].dtype
+            if isinstance(column_dtype, pd.api.types.CategoricalDtype):
+                column_kind, dtype = 'category', np.dtype(np.int32).str
+            elif column_dtype == object:
+                column_kind, dtype = 'string', None
+            else:
+                column_kind, dtype = 'numeric', column_dtype.str
+
+            self.meta['columns'].append({
+                'name': column_name,
+                'kind': column_kind,
+                'dtype': dtype,
+                'file': 'c' + str(idx),
+                'num_bytes': 0,
+                'categories': []
+            })
+
+    def _path(self, column_dict, suffix):
+        return os.path.join(self.store_dir, column_dict['file'] + suffix)
+
+    def _promote_column(self, column_dict, values):
+        """
+        numeric column and a chunk which can not be stored in its dtype - promote the column and rewrite the rows
+        written so far (once per promotion): object chunk -> 'string', other dtype -> np.result_type (e.g. int64 ->
+        float64 when a later chunk has nan). a numeric chunk of a 'string' column is stored as text (_to_bytes)
+        """
+        if column_dict['kind'] != 'numeric':
+            return
+        dtype = np.dtype(column_dict['dtype'])
+        if values.dtype != object and np.can_cast(values.dtype, dtype, casting='same_kind'):
+            return
+
+        path = self._path(column_dict, '.bin')
+        written_values = np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.empty(0, dtype=dtype)
+        if os.path.exists(path):
+            os.remove(path)
+
+        if values.dtype == object:
+            promoted = 'string'
+            column_dict.update({'kind': 'string', 'dtype': None, 'num_bytes': 0})
+            self._append_string(column_dict, written_values.astype(object))
+        else:
+            promoted = np.result_type(dtype, values.dtype).str
+            column_dict['dtype'] = promoted
+            self._append_numeric(column_dict, written_values)
+
+        logging.info('columnar store: column ' + str(column_dict['name']) + ' promoted ' + str(dtype) + ' -> ' +
+                     str(promoted) + ', rows rewritten: ' + str(len(written_values)))
+
+    def _append_numeric(self, column_dict, values):
+        dtype = np.dtype(column_dict['dtype'])
+        if not np.can_cast(values.dtype, dtype, casting='same_kind'):
+            raise ValueError('column ' + str(column_dict['name']) + ' dtype ' + str(values.dtype) +
+                             ' can not be stored as ' + str(dtype))
+
+        with open(self._path(column_dict, '.bin'), 'ab') as f:
+            f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+    def _append_category(self, column_dict, values):
+        # chunk category index -> store category index (new categories are added at the end)
+        store_categories = column_dict['categories']
+        category_index = dict((category, idx) for idx, category in enumerate(store_categories))
+        chunk_to_store = np.empty(len(values.categories) + 1, dtype=np.int32)
+        for idx, category in enumerate(values.categories):
+            if category not in category_index:
+                category_index[category] = len(store_categories)
+                store_categories.append(category)
+            chunk_to_store[idx] = category_index[category]
+        chunk_to_store[-1] = -1     # nan code
+
+        with open(self._path(column_dict, '.bin'), 'ab') as f:
+            f.write(chunk_to_store[values.codes].tobytes())
+
+    def _append_string(self, column_dict, values):
+        null_mask = pd.isnull(values)
+        encoded_list = [b'' if is_null else _to_bytes(value) for value, is_null in zip(values, null_mask)]
+
+        value_length = np.array([len(encoded) for encoded in encoded_list], dtype=np.int64)
+        end_offset = column_dict['num_bytes'] + np.cumsum(value_length)
+        column_dict['num_bytes'] += int(value_length.sum())
+
+        with open(self._path(column_dict, '.bin'), 'ab') as f:
+            f.write(b''.join(encoded_list))
+        with open(self._path(column_dict, '.end.bin'), 'ab') as f:
+            f.write(end_offset.tobytes())
+        with open(self._path(column_dict, '.null.bin'), 'ab') as f:
+            f.write(null_mask.astype(np.uint8).tobytes())
+
+
+def load_columnar(store_dir, columns=None):
+    """
+    load columns from a columnar store, numeric columns are memory-mapped (no parsing)
+    numeric columns stay memory-mapped in the frame (one block per column, copy=False - pandas >= 1.3, older pandas
+    copies them into one block), copy-on-write - writing to a column does not change the store
+    :param columns: list of column names to load (None - all columns)
+    :return: data frame with a range index (same as pd.read_csv of the mirrored csv)
+    """
+    with open(os.path.join(store_dir, META_FILE_NAME), 'r') as f:
+        meta = json.load(f)
+
+    column_dict_map = dict((column_dict['name'], column_dict) for column_dict in meta['columns'])
+    if columns is None:
+        columns = [column_dict['name'] for column_dict in meta['columns']]
+
+    missing_columns = [column_name for column_name in columns if column_name not in column_dict_map]
+    if missing_columns:
+        raise ValueError('columns missing in columnar store: ' + str(missing_columns))
+
+    num_rows = meta['num_rows']
+    data_dict = dict()
+    for column_name in columns:
+        column_dict = column_dict_map[column_name]
+        path = os.path.join(store_dir, column_dict['file'])
+        if column_dict['kind'] == 'numeric':
+            data_dict[column_name] = _memmap(path + '.bin', column_dict['dtype'], num_rows, mode='c')
+        elif column_dict['kind'] == 'category':
+            data_dict[column_name] = pd.Categorical.from_codes(
+                np.asarray(_memmap(path + '.bin', column_dict['dtype'], num_rows)), column_dict['categories'])
+        else:
+            data_dict[column_name] = _load_string(path, num_rows)
+
+    return pd.DataFrame(data_dict, columns=columns, copy=False)
+
+
+def _memmap(path, dtype, num_rows, mode='r'):
+    if num_rows == 0:       # np.memmap does not support empty files
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=np.dtype(dtype), mode=mode, shape=(num_rows,))
+
+
+def _load_string(path, num_rows):
+    end_offset = _memmap(path + '.end.bin', np.int64, num_rows)
+    null_mask = _memmap(path + '.null.bin', np.uint8, num_rows)
+    with open(path + '.bin', 'rb') as f:
+        buffer = f.read()
+
+    values = np.empty(num_rows, dtype=object)
+    start = 0
+    for idx, end in enumerate(end_offset.tolist()):
+        values[idx] = _from_bytes(buffer[start:end])
+        start = end
+    values[null_mask.astype(bool)] = np.nan
+    return values
+
+
+def _to_bytes(value):
+    if not isinstance(value, (bytes, type(u''))):      # e.g. number inside a string column
+        value = str(value)
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def _from_bytes(value):
+    # python 2 - keep byte str (same as pd.read_csv), python 3 - decode
+    return value if str is bytes else value.decode('utf-8')
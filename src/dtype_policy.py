@@ -0,0 +1,68 @@
+from __future__ import print_function
+import logging
+import numpy as np
+import pandas as pd
+
+# compact dtypes of the labelled review frame, shared by CleanData (clean csv/columnar) and TrainModel (load)
+# binary (one vs. all) label columns -> int8
+LABEL_COLUMN_DTYPE = {
+    'review_tag': np.int8,
+    'subjective_sentence': np.int8,
+    'missing_context': np.int8,
+    'Refers to a specific listing aspect': np.int8,
+    'Non-informative sentence': np.int8,
+    'failure_reason': np.int8           # class 0-12
+}
+
+# few distinct strings -> categorical (int8 codes instead of python object per row)
+CATEGORY_COLUMNS = ['Tagging', 'Reason']
+
+
+def apply_dtype_policy(df):
+    """
+    cast label columns to int8 and tagging/reason columns to categorical (in place)
+    columns missing in df are ignored (e.g. TrainModel loads only the model columns)
+    label column with nan, fractions or values out of the int8 range (e.g. older/balanced csv) is left unchanged
+    """
+    for column_name, dtype in LABEL_COLUMN_DTYPE.items():
+        if column_name in df.columns and df[column_name].dtype != dtype:
+            reason = _downcast_failure(df[column_name].values, dtype)
+            if reason is not None:
+                logging.warning('dtype policy: column ' + str(column_name) + ' kept as ' +
+                                str(df[column_name].dtype) + ' - ' + reason)
+                continue
+            df[column_name] = df[column_name].astype(dtype)
+
+    for column_name in CATEGORY_COLUMNS:
+        if column_name in df.columns and not is_categorical(df[column_name]):
+            df[column_name] = df[column_name].astype('category')
+
+    return df
+
+
+def _downcast_failure(values, dtype):
+    """ :return: why values can not be cast to the integer dtype without a change, None - cast is safe """
+    if values.dtype == bool:
+        return None
+    if not pd.api.types.is_numeric_dtype(values.dtype):
+        return 'not numeric'
+    is_float = np.issubdtype(values.dtype, np.floating)
+    if is_float and np.isnan(values).any():
+        return 'has nan'
+    if values.size == 0:
+        return None
+    if is_float and (values != np.round(values)).any():
+        return 'has fractions'
+    dtype_info = np.iinfo(dtype)
+    if values.min() < dtype_info.min or values.max() > dtype_info.max:
+        return 'out of ' + str(np.dtype(dtype)) + ' range'
+    return None
+
+
+def is_categorical(series):
+    return isinstance(series.dtype, pd.api.types.CategoricalDtype)
+
+
+def memory_usage_mb(df):
+    """ deep memory usage (including python string objects) in MB """
+    return round(df.memory_usage(deep=True).sum() / float(1024 ** 2), 3)
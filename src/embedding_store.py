@@ -0,0 +1,292 @@
+from __future__ import print_function
+import os
+import pickle
+import numpy as np
+from collections import OrderedDict
+
+# vectors-only copy of a word embedding (gensim word2vec / glove), without the training state
+#     <prefix>.vectors.npy - float32 matrix (row i = vector of word i), opened with np.load(mmap_mode='r')
+#     <prefix>.vocab.pkl   - list of words (row order)
+# processes that open the same files share one page-cached copy of the matrix
+#     <prefix>.padded.npy  - classifier 'pretrained' index mode: row 0 - padding, row 1 - oov, row i + 2 = word i
+
+VECTORS_SUFFIX = '.vectors.npy'
+VOCAB_SUFFIX = '.vocab.pkl'
+PADDED_VECTORS_SUFFIX = '.padded.npy'
+
+# token ids of the 'pretrained' index mode
+PAD_ROW = 0
+OOV_ROW = 1
+ROW_OFFSET = 2
+
+# embedding matrices built in this process, (store prefix, embedding size, word_index hash) -> (matrix, missing)
+# grid configurations of the same fold share one word_index (sequence cache) and reuse the matrix - the wrapper
+# loops over the folds inside every configuration, the cache holds a matrix per fold (set_embedding_matrix_cache_size)
+EMBEDDING_MATRIX_CACHE_SIZE = 4
+_embedding_matrix_cache = OrderedDict()
+
+# read-only stores opened in this process, prefix -> (file key, VectorStore) - the folds of a run share one store and
+# its word index (built once, on first use) instead of reading the vocabulary again for every classifier
+_vector_store_cache = dict()
+
+
+def set_embedding_matrix_cache_size(cache_size):
+    """ matrices kept by VectorStore.embedding_matrix (least recently used are dropped), 0 - no cache """
+    global EMBEDDING_MATRIX_CACHE_SIZE
+    EMBEDDING_MATRIX_CACHE_SIZE = cache_size
+    while len(_embedding_matrix_cache) > EMBEDDING_MATRIX_CACHE_SIZE:
+        _embedding_matrix_cache.popitem(last=False)
+
+
+def store_exists(prefix):
+    return os.path.exists(prefix + VECTORS_SUFFIX) and os.path.exists(prefix + VOCAB_SUFFIX)
+
+
+def save_vectors(prefix, word_list, vectors):
+    """
+    save vectors and vocabulary, files are written to a temporary name and renamed (readers never see a partial
+    file, e.g. another training process which opens the store at the same time)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(word_list) != vectors.shape[0]:
+        raise ValueError('vocabulary size ' + str(len(word_list)) + ' does not match vectors ' + str(vectors.shape))
+
+    tmp_suffix = '.tmp' + str(os.getpid())
+    with open(prefix + VOCAB_SUFFIX + tmp_suffix, 'wb') as f:
+        pickle.dump(list(word_list), f, protocol=2)         # protocol 2 - readable by python 2 and 3
+    with open(prefix + VECTORS_SUFFIX + tmp_suffix, 'wb') as f:
+        np.save(f, vectors)
+
+    os.rename(prefix + VECTORS_SUFFIX + tmp_suffix, prefix + VECTORS_SUFFIX)
+    os.rename(prefix + VOCAB_SUFFIX + tmp_suffix, prefix + VOCAB_SUFFIX)
+    return
+
+
+def load_vectors(prefix, mmap_mode='r'):
+    """
+    :return: VectorStore with memory-mapped vectors (mmap_mode=None - read into memory)
+    read-only stores (mmap_mode='r') are opened once per process and reused until the store files change
+    """
+    file_key = None
+    if mmap_mode == 'r':
+        file_key = [(file_stat.st_size, file_stat.st_mtime) for file_stat in
+                    (os.stat(prefix + VOCAB_SUFFIX), os.stat(prefix + VECTORS_SUFFIX))]
+        cache_entry = _vector_store_cache.get(prefix)
+        if cache_entry is not None and cache_entry[0] == file_key:
+            return cache_entry[1]
+
+    with open(prefix + VOCAB_SUFFIX, 'rb') as f:
+        word_list = pickle.load(f)
+    vectors = np.load(prefix + VECTORS_SUFFIX, mmap_mode=mmap_mode)
+    vector_store = VectorStore(word_list, vectors, prefix)
+    if file_key is not None:
+        _vector_store_cache[prefix] = (file_key, vector_store)
+    return vector_store
+
+
+class VectorStore(object):
+    """
+    word -> vector lookup over a (memory-mapped) matrix
+    """
+
+    def __init__(self, word_list, vectors, prefix=None):
+        self.word_list = word_list
+        self.vectors = vectors
+        self.prefix = prefix                # files of the store (load_vectors), None - in memory only
+        self._word_to_row = None
+        self._padded_word_index = dict()    # oov_token -> word_index
+
+    @property
+    def word_to_row(self):
+        """ word -> row of the vectors, built on first use and kept with the store """
+        if self._word_to_row is None:
+            self._word_to_row = dict(zip(self.word_list, range(len(self.word_list))))
+        return self._word_to_row
+
+    @property
+    def vector_size(self):
+        return self.vectors.shape[1]
+
+    def __len__(self):
+        return len(self.word_list)
+
+    def __contains__(self, word):
+        return word in self.word_to_row
+
+    def get_vector(self, word):
+        """ :return: vector of word, None if word not in vocabulary """
+        row = self.word_to_row.get(word)
+        return None if row is None else self.vectors[row]
+
+    def padded_word_index(self, oov_token):
+        """
+        word_index of the store rows in the padded matrix (load_padded_vectors), oov_token -> OOV_ROW
+        built once per oov_token and shared by the callers (read-only)
+        """
+        if oov_token not in self._padded_word_index:
+            word_index = dict(zip(self.word_list, range(ROW_OFFSET, len(self.word_list) + ROW_OFFSET)))
+            word_index[oov_token] = OOV_ROW
+            self._padded_word_index[oov_token] = word_index
+        return self._padded_word_index[oov_token]
+
+    def embedding_matrix(self, word_index, embedding_size):
+        """
+        float32 embedding matrix for a keras tokenizer word_index (row 0 - padding), words not found are all-zeros
+        word_index -> store rows in one lookup pass, matrix is filled by one gather from the (memory-mapped) vectors
+        matrices of a stored embedding are cached in the process (read-only, shared by the callers)
+        :return: matrix (len(word_index) + 1, embedding_size), amount of missing words
+        """
+        cache_key = None
+        if self.prefix is not None and EMBEDDING_MATRIX_CACHE_SIZE > 0:
+            cache_key = (self.prefix, embedding_size, word_index_hash(word_index))
+            if cache_key in _embedding_matrix_cache:
+                _embedding_matrix_cache[cache_key] = _embedding_matrix_cache.pop(cache_key)     # most recent
+                return _embedding_matrix_cache[cache_key]
+
+        index = np.fromiter(word_index.values(), dtype=np.int64, count=len(word_index))
+        row = np.fromiter((self.word_to_row.get(word, -1) for word in word_index), dtype=np.int64,
+                          count=len(word_index))
+        found = row >= 0
+
+        embedding_matrix = np.zeros((len(word_index) + 1, embedding_size), dtype=np.float32)
+        if found.any():
+            embedding_matrix[index[found]] = self.vectors[row[found]]
+        result = (embedding_matrix, len(word_index) - int(found.sum()))
+
+        if cache_key is not None:
+            embedding_matrix.flags.writeable = False
+            _embedding_matrix_cache[cache_key] = result
+            while len(_embedding_matrix_cache) > EMBEDDING_MATRIX_CACHE_SIZE:
+                _embedding_matrix_cache.popitem(last=False)
+        return result
+
+
+def load_padded_vectors(prefix, mmap_mode='r'):
+    """
+    store vectors with a padding row and an oov row (all-zeros) in front, written once next to the store (rebuilt if
+    the store vectors are newer) - embedding layer weights without a per-fold embedding matrix
+    :return: (memory-mapped) float32 matrix (len(store) + ROW_OFFSET, vector size)
+    """
+    padded_path = prefix + PADDED_VECTORS_SUFFIX
+    vectors_path = prefix + VECTORS_SUFFIX
+    if not os.path.exists(padded_path) or os.path.getmtime(padded_path) < os.path.getmtime(vectors_path):
+        vectors = np.load(vectors_path, mmap_mode='r')
+        tmp_path = padded_path + '.tmp' + str(os.getpid())
+        padded = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                           shape=(vectors.shape[0] + ROW_OFFSET, vectors.shape[1]))
+        padded[:ROW_OFFSET] = 0
+        padded[ROW_OFFSET:] = vectors
+        padded.flush()
+        del padded
+        os.rename(tmp_path, padded_path)
+    return np.load(padded_path, mmap_mode=mmap_mode)
+
+
+def word_index_hash(word_index):
+    """ md5 of a word_index (words and ids, independent of the dict order) """
+    import hashlib
+
+    # keys() and values() of a dict are in the same order
+    word_array = np.array(list(word_index.keys()), dtype=object)
+    index_array = np.fromiter(word_index.values(), dtype=np.int64, count=len(word_array))
+    order = np.argsort(index_array, kind='mergesort')
+    joined_words = '\n'.join(word_array[order].tolist())
+    if not isinstance(joined_words, bytes):
+        joined_words = joined_words.encode('utf-8')
+
+    md5 = hashlib.md5()
+    md5.update(index_array[order].tobytes())
+    md5.update(joined_words)
+    return md5.hexdigest()
+
+
+def prune_vectors(word_list, vectors, word_count, top_k=None, min_count=None):
+    """
+    keep the frequent words of an embedding
+    :param word_count: corpus frequency of every word (word_list order)
+    :param top_k: max words kept (None - no limit), most frequent first
+    :param min_count: min frequency of a kept word (None - no floor)
+    :return: word list sorted by descending frequency, vectors of the kept words (same order)
+    """
+    word_count = np.asarray(word_count, dtype=np.int64)
+    order = np.argsort(-word_count, kind='mergesort')      # stable - ties keep the vocabulary order
+    if min_count is not None:
+        order = order[word_count[order] >= min_count]
+    if top_k is not None:
+        order = order[:top_k]
+    return [word_list[row] for row in order], vectors[order]
+
+
+def vocabulary_coverage(word_count_dict, vocabulary):
+    """
+    coverage of a text by a vocabulary (VectorStore, dict or set)
+    :param word_count_dict: word -> amount in the text
+    :return: dict - distinct words and word occurrences (tokens) found in the vocabulary
+    """
+    num_words = len(word_count_dict)
+    num_tokens = sum(word_count_dict.values())
+    words_found = 0
+    tokens_found = 0
+    for word, count in word_count_dict.items():
+        if word in vocabulary:
+            words_found += 1
+            tokens_found += count
+    return {
+        'words': num_words,
+        'words_found': words_found,
+        'word_coverage': round(words_found / float(max(num_words, 1)), 4),
+        'tokens': num_tokens,
+        'tokens_found': tokens_found,
+        'token_coverage': round(tokens_found / float(max(num_tokens, 1)), 4)
+    }
+
+
+def load_glove(glove_path, mmap_mode='r'):
+    """
+    glove text file (word v1 v2 ... per line) as a VectorStore
+    the text is parsed once into a vectors-only copy next to the file (<glove_path>.<md5>), keyed by the file
+    checksum - every later load is a memory-mapped open
+    """
+    prefix = glove_path + '.' + file_checksum(glove_path)[:12]
+    if not store_exists(prefix):
+        word_list, vectors = _parse_glove(glove_path)
+        save_vectors(prefix, word_list, vectors)
+    return load_vectors(prefix, mmap_mode=mmap_mode)
+
+
+def file_checksum(path, block_size=2 ** 20):
+    """
+    md5 of a file, memoized in <path>.md5 together with the file size and mtime (hashed again only if they change)
+    """
+    import json
+    import hashlib
+
+    file_stat = os.stat(path)
+    file_key = [file_stat.st_size, file_stat.st_mtime]      # full mtime - a same second rewrite is hashed again
+    memo_path = path + '.md5'
+    if os.path.exists(memo_path):
+        with open(memo_path, 'r') as f:
+            memo_dict = json.load(f)
+        if memo_dict['file_key'] == file_key:
+            return memo_dict['md5']
+
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+
+    with open(memo_path, 'w') as f:
+        json.dump({'file_key': file_key, 'md5': md5.hexdigest()}, f)
+    return md5.hexdigest()
+
+
+def _parse_glove(glove_path):
+    """ :return: list of words (python 2 - byte str, python 3 - str), float32 matrix """
+    word_list = list()
+    vector_list = list()
+    with open(glove_path, 'rb') as f:
+        for line in f:
+            values = line.split()
+            word_list.append(values[0] if str is bytes else values[0].decode('utf-8'))
+            vector_list.append(np.asarray(values[1:], dtype=np.float32))
+    return word_list, np.vstack(vector_list)
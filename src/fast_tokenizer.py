@@ -0,0 +1,122 @@
+from __future__ import print_function
+import re
+import numpy as np
+
+# keras Tokenizer replacement for the classifier (same word_index and same padded sequences)
+#     1. text -> words: lower, filter characters -> split character (one compiled regex), split, drop empty words
+#     2. fit: words sorted by descending frequency (ties - first seen first), oov token is index 1
+#     3. texts -> token ids written directly into a preallocated int32 (n, maxlen) array
+#        keras pad_sequences defaults: padding='pre', truncating='pre', value 0
+# large inputs are split to chunks converted in a process pool (word_index is sent once per worker)
+
+# filters of the classifier tokenizer (keras default filters with ' instead of ")
+DEFAULT_FILTERS = "!'#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n"
+
+# state of a pool worker (set once by _init_worker)
+_worker_tokenizer = None
+_worker_maxlen = None
+
+
+class FastTokenizer(object):
+    """
+    text tokenizer with the keras.preprocessing.text.Tokenizer semantics (char_level=False)
+    :param num_words: ids >= num_words are replaced by the oov token id (dropped without oov token), None - all
+    :param oov_token: token of out-of-vocabulary words (index 1 of word_index), None - oov words are dropped
+    """
+
+    def __init__(self, num_words=None, filters=DEFAULT_FILTERS, lower=True, split=' ', oov_token=None):
+
+        self.num_words = num_words
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.oov_token = oov_token
+
+        self.filter_regex = re.compile('[' + re.escape(filters) + ']') if filters else None
+        self.word_counts = dict()
+        self.word_index = dict()
+        self.document_count = 0
+
+    def text_to_word_sequence(self, text):
+        if self.lower:
+            text = text.lower()
+        if self.filter_regex is not None:
+            text = self.filter_regex.sub(self.split, text)
+        return [word for word in text.split(self.split) if word]
+
+    def fit_on_texts(self, texts):
+        """ build word_index - same word ids as keras Tokenizer.fit_on_texts """
+        first_seen = dict()
+        for text in texts:
+            self.document_count += 1
+            for word in self.text_to_word_sequence(text):
+                if word in self.word_counts:
+                    self.word_counts[word] += 1
+                else:
+                    self.word_counts[word] = 1
+                    first_seen[word] = len(first_seen)
+
+        # keras keeps word_counts ordered by first appearance and sorts it (stable) by descending count
+        word_list = sorted(self.word_counts, key=lambda word: (-self.word_counts[word], first_seen[word]))
+        if self.oov_token is not None:
+            word_list = [self.oov_token] + word_list
+        self.word_index = dict(zip(word_list, range(1, len(word_list) + 1)))
+        return
+
+    def texts_to_padded_sequences(self, texts, maxlen, workers=1, chunk_size=20000):
+        """
+        texts -> int32 array (len(texts), maxlen), same as keras pad_sequences(texts_to_sequences(texts), maxlen)
+        :param workers: processes, used only if there is more than one chunk of texts
+        """
+        texts = list(texts)
+        padded = np.zeros((len(texts), maxlen), dtype=np.int32)
+        if workers <= 1 or len(texts) <= chunk_size:
+            self._fill_padded(texts, padded)
+            return padded
+
+        from multiprocessing import Pool
+
+        chunk_start_list = range(0, len(texts), chunk_size)
+        pool = Pool(processes=workers, initializer=_init_worker, initargs=(self._worker_state(), maxlen))
+        try:
+            chunk_iter = (texts[start:start + chunk_size] for start in chunk_start_list)
+            for start, padded_chunk in zip(chunk_start_list, pool.imap(_padded_chunk_worker, chunk_iter)):
+                padded[start:start + len(padded_chunk)] = padded_chunk
+        finally:
+            pool.close()
+            pool.join()
+        return padded
+
+    def _fill_padded(self, texts, padded):
+        """ write the token ids of every text at the end of its row (pre-padding), keep the last maxlen ids """
+        maxlen = padded.shape[1]
+        oov_index = self.word_index.get(self.oov_token) if self.oov_token is not None else None
+        word_index = self.word_index
+        if self.num_words:
+            word_index = dict((word, i) for word, i in word_index.items() if i < self.num_words)
+
+        for row, text in enumerate(texts):
+            word_list = self.text_to_word_sequence(text)
+            if oov_index is not None:
+                sequence = [word_index.get(word, oov_index) for word in word_list]
+            else:
+                sequence = [word_index[word] for word in word_list if word in word_index]
+            if sequence:
+                sequence = sequence[-maxlen:]
+                padded[row, maxlen - len(sequence):] = sequence
+        return padded
+
+    def _worker_state(self):
+        tokenizer = FastTokenizer(self.num_words, self.filters, self.lower, self.split, self.oov_token)
+        tokenizer.word_index = self.word_index
+        return tokenizer
+
+
+def _init_worker(tokenizer, maxlen):
+    global _worker_tokenizer, _worker_maxlen
+    _worker_tokenizer = tokenizer
+    _worker_maxlen = maxlen
+
+
+def _padded_chunk_worker(texts):
+    return _worker_tokenizer._fill_padded(texts, np.zeros((len(texts), _worker_maxlen), dtype=np.int32))
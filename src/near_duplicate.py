@@ -0,0 +1,192 @@
+from __future__ import print_function
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+# near-duplicate reviews detection (MinHash + LSH)
+#     1. every review is lower-cased and split into word shingles (k consecutive tokens)
+#     2. MinHash signature - min of num_perm random hash functions over the review shingles
+#        (probability that two signatures agree on a position = Jaccard similarity of the shingle sets)
+#     3. LSH - signature is split into num_bands bands, reviews with an identical band are candidates
+#     4. candidates are verified by the fraction of agreeing signature positions (estimated Jaccard)
+#     5. clusters = connected components of the verified pairs
+# only reviews sharing a band bucket are compared, there is no all-pairs comparison
+
+_MAX_UINT32 = np.uint64(0xFFFFFFFF)
+_MIX_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)     # odd 64-bit constant used to combine hashes
+
+
+class NearDuplicateDetector(object):
+    """
+    find near-duplicate clusters in a series of reviews
+    :param shingle_size: tokens per shingle (reviews shorter than shingle_size are a single shingle)
+    :param num_perm: MinHash signature length
+    :param num_bands: LSH bands (num_perm must be divisible by num_bands)
+    :param threshold: minimal estimated Jaccard similarity of a near-duplicate pair
+    :param batch_size: max shingles hashed at once (memory: batch_size * num_perm * 8 bytes)
+    """
+
+    def __init__(self, shingle_size=3, num_perm=128, num_bands=16, threshold=0.8, batch_size=100000, seed=0):
+
+        if num_perm % num_bands != 0:
+            raise ValueError('num_perm (' + str(num_perm) + ') must be divisible by num_bands (' +
+                             str(num_bands) + ')')
+
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        self.band_rows = num_perm // num_bands
+        self.threshold = threshold
+        self.batch_size = batch_size
+
+        # hash function i: (a_i * x + b_i) mod 2^64, upper 32 bits (multiply-shift), a_i odd
+        random_state = np.random.RandomState(seed)
+        self.hash_a = random_state.randint(1, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64) * \
+            np.uint64(2) + np.uint64(1)
+        self.hash_b = random_state.randint(0, 2 ** 62, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def find_clusters(self, review_series):
+        """
+        :return: np.array of cluster id per review (cluster id = position of the first review in the cluster),
+                 reviews without near-duplicates are a cluster of their own
+        """
+        num_reviews = len(review_series)
+
+        start_time = time.time()
+        signature = self.signatures(review_series)
+        signature_time = time.time() - start_time
+
+        start_time = time.time()
+        first_review, second_review = self._candidate_pairs(signature)
+        num_candidates = len(first_review)
+
+        # verify candidates - estimated Jaccard similarity over the full signature
+        similarity = (signature[first_review] == signature[second_review]).mean(axis=1)
+        verified = similarity >= self.threshold
+        first_review, second_review = first_review[verified], second_review[verified]
+
+        cluster_id = _connected_components(first_review, second_review, num_reviews)
+        logging.info('near duplicate: reviews: ' + str(num_reviews) + ', signature time: ' +
+                     str(round(signature_time, 3)) + ' sec, lsh time: ' + str(round(time.time() - start_time, 3)) +
+                     ' sec, candidate pairs: ' + str(num_candidates) + ', verified pairs: ' +
+                     str(len(first_review)))
+        return cluster_id
+
+    def signatures(self, review_series):
+        """ :return: np.array (num reviews, num_perm) uint32 MinHash signatures, empty review -> max uint32 """
+        shingle_hash, shingle_end = self._shingle_hashes(review_series)
+
+        num_reviews = len(shingle_end)
+        signature = np.full((num_reviews, self.num_perm), _MAX_UINT32, dtype=np.uint32)
+        shingle_start = np.concatenate([[0], shingle_end[:-1]])
+        non_empty = np.flatnonzero(shingle_end > shingle_start)
+
+        # batches of whole reviews, each batch hash at most ~batch_size shingles
+        batch_first = 0
+        while batch_first < len(non_empty):
+            batch_last = np.searchsorted(shingle_end[non_empty], shingle_start[non_empty[batch_first]] +
+                                         self.batch_size, side='right')
+            batch_last = max(batch_last, batch_first + 1)
+            review_idx = non_empty[batch_first:batch_last]
+
+            first_shingle = shingle_start[review_idx[0]]
+            batch_hash = shingle_hash[first_shingle:shingle_end[review_idx[-1]]]
+            with np.errstate(over='ignore'):
+                permuted = (batch_hash[:, None] * self.hash_a[None, :] + self.hash_b[None, :]) >> np.uint64(32)
+            signature[review_idx] = np.minimum.reduceat(permuted, shingle_start[review_idx] - first_shingle,
+                                                        axis=0).astype(np.uint32)
+            batch_first = batch_last
+
+        return signature
+
+    def _shingle_hashes(self, review_series):
+        """
+        :return: uint64 hash of every shingle (reviews concatenated), end position of every review shingles
+        """
+        token_list_series = review_series.fillna('').astype(str).str.lower().str.split()
+        token_amount = token_list_series.str.len().values.astype(np.int64)
+        token_end = np.cumsum(token_amount)
+
+        flat_token_list = [token for token_list in token_list_series.values for token in token_list]
+        token_hash = pd.util.hash_array(np.array(flat_token_list, dtype=object)) if flat_token_list else \
+            np.zeros(0, dtype=np.uint64)
+
+        # shingle at every token position that starts k tokens (or a whole shorter review)
+        shingle_amount = np.where(token_amount >= self.shingle_size, token_amount - self.shingle_size + 1,
+                                  np.minimum(token_amount, 1))
+        review_of_token = np.repeat(np.arange(len(token_amount)), token_amount)
+        position = np.arange(len(token_hash)) - (token_end - token_amount)[review_of_token]
+        is_shingle_start = position < shingle_amount[review_of_token]
+
+        shingle_hash = np.zeros(len(token_hash), dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            for offset in range(self.shingle_size):
+                token_idx = np.arange(len(token_hash)) + offset
+                in_review = token_idx < token_end[review_of_token]
+                offset_hash = np.where(in_review, token_hash[np.minimum(token_idx, len(token_hash) - 1)],
+                                       np.uint64(0))
+                shingle_hash = shingle_hash * _MIX_MULTIPLIER + offset_hash
+
+        return shingle_hash[is_shingle_start], np.cumsum(shingle_amount)
+
+    def _candidate_pairs(self, signature):
+        """ reviews with an identical band; each review is paired with the previous and the first in its bucket """
+        non_empty = np.flatnonzero(signature[:, 0] != np.uint32(_MAX_UINT32))
+        first_list, second_list = list(), list()
+
+        for band in range(self.num_bands):
+            band_signature = signature[non_empty, band * self.band_rows:(band + 1) * self.band_rows]
+            band_key = np.zeros(len(non_empty), dtype=np.uint64)
+            with np.errstate(over='ignore'):
+                for column in range(self.band_rows):
+                    band_key = band_key * _MIX_MULTIPLIER + band_signature[:, column].astype(np.uint64)
+
+            order = np.argsort(band_key, kind='mergesort')
+            sorted_key = band_key[order]
+            same_bucket = np.flatnonzero(sorted_key[1:] == sorted_key[:-1]) + 1
+            if len(same_bucket) == 0:
+                continue
+
+            # first position of the bucket of every sorted review
+            bucket_first = np.flatnonzero(np.concatenate([[True], sorted_key[1:] != sorted_key[:-1]]))
+            bucket_of = np.searchsorted(bucket_first, same_bucket, side='right') - 1
+
+            first_list.extend([non_empty[order[same_bucket - 1]], non_empty[order[bucket_first[bucket_of]]]])
+            second_list.extend([non_empty[order[same_bucket]], non_empty[order[same_bucket]]])
+
+        if not first_list:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        pair = np.unique(np.stack([np.concatenate(first_list), np.concatenate(second_list)], axis=1), axis=0)
+        pair = pair[pair[:, 0] != pair[:, 1]]
+        return pair[:, 0], pair[:, 1]
+
+
+def _connected_components(first_review, second_review, num_reviews):
+    """ :return: cluster id per review = smallest review position in its connected component """
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    graph = coo_matrix((np.ones(len(first_review), dtype=np.int8), (first_review, second_review)),
+                       shape=(num_reviews, num_reviews))
+    _, component = connected_components(graph, directed=False)
+
+    # component label -> first review position (min over component members)
+    component_first = np.full(component.max() + 1 if num_reviews else 0, num_reviews, dtype=np.int64)
+    np.minimum.at(component_first, component, np.arange(num_reviews))
+    return component_first[component]
+
+
+def cluster_statistic(cluster_id):
+    """ :return: dict with duplicate clusters amount, duplicate reviews amount and cluster size distribution """
+    cluster_size = np.bincount(cluster_id, minlength=len(cluster_id))
+    duplicate_cluster_size = cluster_size[cluster_size > 1]
+    return {
+        'reviews': len(cluster_id),
+        'duplicate_clusters': len(duplicate_cluster_size),
+        'duplicate_reviews': int((duplicate_cluster_size - 1).sum()),      # all but the first of each cluster
+        'max_cluster_size': int(duplicate_cluster_size.max()) if len(duplicate_cluster_size) else 1,
+        'cluster_size_amount': dict((int(size), int(amount)) for size, amount in
+                                    zip(*np.unique(duplicate_cluster_size, return_counts=True)))
+    }
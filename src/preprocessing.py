@@ -3,69 +3,112 @@ import pandas as pd
 import logging
 import numpy as np
 import matplotlib.pyplot as plt
+from columnar_store import ColumnarWriter, get_store_dir
+from dtype_policy import apply_dtype_policy, memory_usage_mb
+
+# failure reason class = index in the list (Reason is stripped and lower-cased before matching)
+REASON_CLASS_LIST = [
+    'subjective sentence',                          # 0
+    'missing context',                              # 1
+    'refers to a specific listing aspect',          # 2
+    'non-informative sentence',                     # 3
+    'poor language (spelling mistakes)',            # 4
+    'purely negative sentence',                     # 5
+    'expresses explicit doubt',                     # 6
+    'refers to the description',                    # 7
+    'too detailed',                                 # 8
+    'other (please explain in comments column)',    # 9
+    'offensive language',                           # 10
+    'too specific/narrow'                           # 11
+]
+GOOD_REVIEW_CLASS = 12                              # nan - good review
+
+# one vs. all binary columns -> failure reason class
+INDICATOR_COLUMN_CLASS = [
+    ('subjective_sentence', 0),
+    ('missing_context', 1),
+    ('Refers to a specific listing aspect', 2),
+    ('Non-informative sentence', 3)
+]
 
 
 class CleanData:
     '''
     remain only valid users
-    check duplication
+    check duplication (near-duplicate reviews, MinHash/LSH)
     remove according to threshold defined
     '''
 
-    def __init__(self, input_data_file, vertical_type, output_clean_folder):
+    def __init__(self, input_data_file, vertical_type, output_clean_folder, chunk_size=None,
+                 dedup_configuration_dict=None, logger=None):
 
         # file arguments
         self.input_data_file = input_data_file          # csv input file
         self.vertical_type = vertical_type              # 'fashion'/'motors'
         self.output_clean_folder = output_clean_folder  # output folder to store clean data
+        self.chunk_size = chunk_size                    # None - load all csv, int - streaming mode rows per chunk
+        self.dedup_configuration_dict = dedup_configuration_dict    # None - keep duplicates, dict - MinHash/LSH
 
         self.verbose_flag = True
+        self.logging = logger if logger is not None else logging    # None - root logger, pool worker - own logger
 
         from time import gmtime, strftime
         self.cur_time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
 
         # define data frame needed for analyzing data
         self.data_set_df = pd.DataFrame()
+        self.input_rows = 0                             # rows in input csv
+        self.clean_rows = 0                             # rows in clean csv
 
     # init log file
     def init_debug_log(self):
         import logging
-
-        lod_file_name = './log/' + 'clean_data_' + str(self.cur_time) + '.log'
-
-        logging.basicConfig(filename=lod_file_name,
-                            format='%(asctime)s, %(levelname)s %(message)s',
-                            datefmt='%H:%M:%S',
-                            level=logging.DEBUG)
         import os
-        if not os.path.exists(lod_file_name):
-            os.makedirs(lod_file_name)
-
-        # print result in addition to log file
-        if self.verbose_flag:
-            stderrLogger = logging.StreamHandler()
-            stderrLogger.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
-            logging.getLogger().addHandler(stderrLogger)
-
-        logging.info("")
-        logging.info("")
-        logging.info("start log program")
+
+        lod_dir = './log/'
+        lod_file_name = lod_dir + 'clean_data_' + str(self.vertical_type) + '_' + str(self.cur_time) + '.log'
+        if not os.path.exists(lod_dir):
+            os.makedirs(lod_dir)
+
+        if self.logging is not logging:
+            # own logger (pool worker) - own log file, pid in the name (verticals start in the same second)
+            file_handler = logging.FileHandler(lod_file_name[:-len('.log')] + '_' + str(os.getpid()) + '.log')
+            file_handler.setFormatter(logging.Formatter('%(asctime)s, %(levelname)s %(message)s', datefmt='%H:%M:%S'))
+            self.logging.addHandler(file_handler)
+            self.logging.setLevel(logging.DEBUG)
+            self.logging.propagate = False      # not written to the handlers of the root logger
+        else:
+            logging.basicConfig(filename=lod_file_name,
+                                format='%(asctime)s, %(levelname)s %(message)s',
+                                datefmt='%H:%M:%S',
+                                level=logging.DEBUG)
+
+            # print result in addition to log file
+            if self.verbose_flag:
+                stderrLogger = logging.StreamHandler()
+                stderrLogger.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+                logging.getLogger().addHandler(stderrLogger)
+
+        self.logging.info("")
+        self.logging.info("")
+        self.logging.info("start log program")
         return
 
     # load csv into df
     def load_clean_csv_results(self):
 
         self.data_set_df = pd.read_csv(self.input_data_file)
+        self.input_rows = self.data_set_df.shape[0]
 
         return
 
     # statistical analysis
     def statistical_data(self):
 
-        logging.info('Data vertical type: ' + str(self.vertical_type))
-        logging.info('start statistical meta analysis')
-        logging.info('')
-        logging.info('data size: ' + str(self.data_set_df.shape[0]))
+        self.logging.info('Data vertical type: ' + str(self.vertical_type))
+        self.logging.info('start statistical meta analysis')
+        self.logging.info('')
+        self.logging.info('data size: ' + str(self.data_set_df.shape[0]))
 
         self._target_column_analysis()
         self._review_analysis()
@@ -75,83 +118,112 @@ class CleanData:
 
     def _target_column_analysis(self):
 
-        logging.info('')
-        logging.info('Tagging analysis (Y)')
-        y_group = self.data_set_df.groupby(['Tagging'])
-        for group_type, tag_group in y_group:
-            group_percentage = float(tag_group.shape[0]) / float(self.data_set_df.shape[0])
-            logging.info('Tag: ' + str(group_type) + ', amount: ' + str(tag_group.shape[0]) + ', percentage: ' + str(
+        tag_amount_dict = self.data_set_df['Tagging'].value_counts().to_dict()
+        self._log_target_column(tag_amount_dict, self.data_set_df.shape[0])
+        return
+
+    def _log_target_column(self, tag_amount_dict, data_size):
+
+        self.logging.info('')
+        self.logging.info('Tagging analysis (Y)')
+        for group_type in sorted(tag_amount_dict):
+            group_percentage = float(tag_amount_dict[group_type]) / float(data_size)
+            self.logging.info('Tag: ' + str(group_type) + ', amount: ' + str(tag_amount_dict[group_type]) + ', percentage: ' + str(
                 round(group_percentage, 2)))
 
         return
 
     def _review_analysis(self):
 
-        logging.info('')
-        logging.info('Reviews analysis')
+        self.logging.info('')
+        self.logging.info('Reviews analysis')
 
         # add review length column
-        self.data_set_df['review_length'] = np.nan
-
-        # calculate review length
-        for index, row in self.data_set_df.iterrows():
-            if isinstance(row['Review'], basestring):
-                review_length = len(row['Review'].split(' ')) - 1.0
-            else:
-                review_length = 0
-            self.data_set_df.at[index, 'review_length'] = review_length
+        self.data_set_df['review_length'] = self._calculate_review_length(self.data_set_df['Review'])
 
         # delete review with 0 length - empty
         init_data_size = self.data_set_df.shape[0]
         self.data_set_df = self.data_set_df[self.data_set_df['review_length'] != 0]
-        logging.info('Reviews deleted because size=0: ' + str(init_data_size - self.data_set_df.shape[0]))
-        logging.info('')
+        self.logging.info('Reviews deleted because size=0: ' + str(init_data_size - self.data_set_df.shape[0]))
+        self.logging.info('')
 
         # calculate review statistic
-        percentile_series = self.data_set_df['review_length'].quantile([.25, .5, .75])
-        review_q1 = percentile_series[.25]
-        review_median = percentile_series[.5]
-        review_q3 = percentile_series[.75]
-        review_std = self.data_set_df['review_length'].std()
-        review_max = self.data_set_df['review_length'].max()
-        review_min = self.data_set_df['review_length'].min()
-
-        logging.info('Reviews min: ' + str(round(review_min, 2)))
-        logging.info('Reviews Q1: ' + str(round(review_q1, 2)))
-        logging.info('Reviews median: ' + str(round(review_median, 2)))
-        logging.info('Reviews Q3: ' + str(round(review_q3, 2)))
-        logging.info('Reviews max: ' + str(round(review_max, 2)))
-        logging.info('Reviews std: ' + str(round(review_std, 2)))
+        review_statistic_dict = self._review_length_statistic(self.data_set_df['review_length'].values)
+        self._log_review_statistic(review_statistic_dict)
 
         # histogram of reviews length
+        self._plot_review_length_histogram(self.data_set_df['review_length'], review_statistic_dict['max'])
+
+        return
+
+    @staticmethod
+    def _calculate_review_length(review_series):
+        """
+        vectorized review length - number of ' ' in the review (same as len(review.split(' ')) - 1)
+        :param review_series: series of reviews, non-string values (e.g. nan) get length 0
+        :return: float series aligned to review_series index
+        """
+        if review_series.dtype != object:      # no string at all (e.g. all reviews are nan)
+            return pd.Series(0.0, index=review_series.index)
+
+        return review_series.str.count(' ').fillna(0).astype(np.float64)
+
+    @staticmethod
+    def _review_length_statistic(review_length):
+        """
+        quantile/min/max/std of review length, same values as pandas quantile (linear) and std (ddof=1)
+        :param review_length: numpy array of review length (without empty reviews)
+        """
+        review_length = np.asarray(review_length, dtype=np.float64)
+        review_q1, review_median, review_q3 = np.percentile(review_length, [25, 50, 75])
+
+        return {
+            'min': review_length.min(),
+            'q1': review_q1,
+            'median': review_median,
+            'q3': review_q3,
+            'max': review_length.max(),
+            'std': review_length.std(ddof=1)
+        }
+
+    def _log_review_statistic(self, review_statistic_dict):
+
+        self.logging.info('Reviews min: ' + str(round(review_statistic_dict['min'], 2)))
+        self.logging.info('Reviews Q1: ' + str(round(review_statistic_dict['q1'], 2)))
+        self.logging.info('Reviews median: ' + str(round(review_statistic_dict['median'], 2)))
+        self.logging.info('Reviews Q3: ' + str(round(review_statistic_dict['q3'], 2)))
+        self.logging.info('Reviews max: ' + str(round(review_statistic_dict['max'], 2)))
+        self.logging.info('Reviews std: ' + str(round(review_statistic_dict['std'], 2)))
+        return
+
+    # weights - amount of every review length value (streaming histogram), None - one review per value
+    def _plot_review_length_histogram(self, review_length, review_max, weights=None):
+
         import matplotlib.pyplot as plt
         plt.figure()
         plt.title('Histogram of review length')
         plt.xlabel('Review length')
         plt.ylabel('Amount')
-        plt.hist(self.data_set_df['review_length'], bins=int(review_max - 0), range=(0, review_max))
+        plt.hist(review_length, bins=int(review_max - 0), range=(0, review_max), weights=weights)
         plt.savefig(
             '/Users/sguyelad/PycharmProjects/reviews_classifier/results/statistics/' + 'histogram_' + str(self.vertical_type) + '_review_length')
         plt.close()
-
-
         return
 
     def _reason_failure_analysis(self):
 
-        logging.info('')
-        logging.info('Reason failure analysis')
-
         # remain only reviews which do not fit into descriptions
         failure_df = self.data_set_df[self.data_set_df['Tagging'] == 'Bad']
-        logging.info('Bad reviews amount: ' + str(failure_df.shape[0]))
+        failure_type_amount_dict = failure_df['Reason'].value_counts().to_dict()
+
+        self._log_reason_failure(failure_type_amount_dict, failure_df.shape[0])
+        return
 
-        failure_type_group = failure_df.groupby(['Reason'])
+    def _log_reason_failure(self, failure_type_amount_dict, failure_size):
 
-        # sort failure amount into dictionary
-        failure_type_amount_dict = {}
-        for group_name, group_df in failure_type_group:
-            failure_type_amount_dict[group_name] = group_df.shape[0]
+        self.logging.info('')
+        self.logging.info('Reason failure analysis')
+        self.logging.info('Bad reviews amount: ' + str(failure_size))
 
         # sort occurrences by failure reason amount
         import operator
@@ -159,15 +231,15 @@ class CleanData:
         sorted_by_amount.reverse()
 
         # log failure type
-        logging.info('')
-        logging.info('Failure type amount:')
+        self.logging.info('')
+        self.logging.info('Failure type amount:')
         for cur_tuple in sorted_by_amount:
             failure_type = cur_tuple[0]
             amount = cur_tuple[1]
-            perncetile_group = float(amount)/float(failure_df.shape[0])
+            perncetile_group = float(amount)/float(failure_size)
             aligned_type = '{:<43}'.format(failure_type)
             aligned_amount = '{:<6}'.format(amount)
-            logging.info('Type: ' + str(aligned_type) + 'Amount: ' + str(aligned_amount) + 'percentile: ' + str(round(perncetile_group, 3)))
+            self.logging.info('Type: ' + str(aligned_type) + 'Amount: ' + str(aligned_amount) + 'percentile: ' + str(round(perncetile_group, 3)))
 
         # create bar plot
         failure_type_amount_dict_new = {}
@@ -200,92 +272,292 @@ class CleanData:
     # a. delete reviews with 0-length
     # b. change prediction to binary Bad-good to 0:1
     # c. change reason prediction to multi-class
+    # d. check duplication (near-duplicate reviews)
+    # e. compact dtypes
     def clean_df(self):
 
-        logging.info('')
-        logging.info('clean data before start model:')
+        self.logging.info('')
+        self.logging.info('clean data before start model:')
 
-        # a. delete reviews with 0-length
-        self.data_set_df = self.data_set_df[self.data_set_df['review_length'] != 0]
+        # a. delete reviews with 0-length (own frame - label columns are added)
+        self.data_set_df = self.data_set_df[self.data_set_df['review_length'] != 0].copy()
 
         # b. change prediction to binary Bad-good to 0:1
-        self.data_set_df['review_tag'] = np.nan
-        self.data_set_df['review_tag'] = np.where(self.data_set_df['Tagging'] == 'Bad', 0, 1)   # good - 1, bad - 0
+        # c. change reason prediction to multi-class and to binary (one vs. all) columns
+        self._add_label_columns(self.data_set_df)
 
-        # b. change subjective to binary 0:1
-        self.data_set_df['subjective_sentence'] = np.nan
-        self.data_set_df['subjective_sentence'] = np.where(self.data_set_df['Reason'] == 'Subjective sentence', 1, 0)
+        # d. check duplication - drop/tag near-duplicate reviews
+        if self.dedup_configuration_dict is not None and self.dedup_configuration_dict['dedup_bool']:
+            self.check_duplication()
 
-        # c. change missing context to Binary 0:1
-        self.data_set_df['missing_context'] = np.nan
-        self.data_set_df['missing_context'] = np.where(self.data_set_df['Reason'] == 'Missing context', 1, 0)
+        # e. compact dtypes (int8 labels, categorical tagging/reason)
+        memory_before = memory_usage_mb(self.data_set_df)
+        apply_dtype_policy(self.data_set_df)
+        self.logging.info('df memory usage (deep): ' + str(memory_before) + ' MB -> ' +
+                     str(memory_usage_mb(self.data_set_df)) + ' MB after dtype policy')
 
-        # c. change missing context to Binary 0:1
-        self.data_set_df['Refers to a specific listing aspect'] = np.nan
-        self.data_set_df['Refers to a specific listing aspect'] = np.where(self.data_set_df['Reason'] == 'Refers to a specific listing aspect', 1, 0)
+        # save clean df
+        file_path = self._get_clean_file_path()
+        self.data_set_df.to_csv(file_path)
+        self.clean_rows = self.data_set_df.shape[0]
 
-        # c. change missing context to Binary 0:1
-        self.data_set_df['Non-informative sentence'] = np.nan
-        self.data_set_df['Non-informative sentence'] = np.where(
-            self.data_set_df['Reason'].isin(['Non-informative sentence ', 'Non-informative sentence']), 1, 0)
+        # save typed columnar copy - train loads only the columns it needs without parsing the csv
+        columnar_writer = ColumnarWriter(get_store_dir(file_path))
+        columnar_writer.append(self.data_set_df)
+        columnar_writer.close(file_path)
 
-        # c. change reason prediction to multi-class
-        self.data_set_df['failure_reason'] = np.nan
+        self.logging.info('')
+        self.logging.info('save clean df: ' + file_path)
+        self.logging.info('save clean columnar df: ' + get_store_dir(file_path))
+        return
 
-        # calculate review length
-        for index, row in self.data_set_df.iterrows():
-            # print(row['Reason'])
-            if isinstance(row['Reason'], basestring):
-                self.data_set_df.at[index, 'failure_reason'] = self._reason_class_mapping(row['Reason'])
-            else:   # nan - good review
-                self.data_set_df.at[index, 'failure_reason'] = 12   # nan
+    # streaming mode - same steps as load_clean_csv_results + statistical_data + clean_df, chunk by chunk
+    # only running statistics are kept in memory, clean chunks are appended to the clean csv
+    def stream_clean_csv_results(self):
 
-        # save clean df
-        file_path = self.output_clean_folder + 'clean_data_multi_new_' + str(self.vertical_type) + '.csv'
-        self.data_set_df.to_csv(file_path)
+        from collections import Counter
+        from sketches import StreamingHistogram
+
+        self.logging.info('Data vertical type: ' + str(self.vertical_type))
+        self.logging.info('start streaming statistical meta analysis, chunk size: ' + str(self.chunk_size))
+        if self.dedup_configuration_dict is not None and self.dedup_configuration_dict['dedup_bool']:
+            self.logging.warning('check duplication needs all reviews in memory - skipped in streaming mode')
+
+        data_size = 0                                   # all reviews
+        empty_review_size = 0                           # reviews with 0 length
+        failure_size = 0                                # bad reviews (after removing empty reviews)
+        tag_amount_counter = Counter()                  # Tagging -> amount
+        failure_type_amount_counter = Counter()         # Reason -> amount (bad reviews only)
+        review_length_histogram = StreamingHistogram()  # review length -> amount
+
+        file_path = self._get_clean_file_path()
+        import os
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        columnar_writer = ColumnarWriter(get_store_dir(file_path))
+
+        chunk_iterator = pd.read_csv(self.input_data_file,
+                                     chunksize=self.chunk_size,
+                                     dtype={'Review': object, 'Tagging': object, 'Reason': object})
+
+        for chunk_num, chunk_df in enumerate(chunk_iterator):
+
+            data_size += chunk_df.shape[0]
+            tag_amount_counter.update(chunk_df['Tagging'].value_counts().to_dict())
+
+            # a. delete reviews with 0-length
+            chunk_df['review_length'] = self._calculate_review_length(chunk_df['Review'])
+            init_chunk_size = chunk_df.shape[0]
+            chunk_df = chunk_df[chunk_df['review_length'] != 0].copy()     # own frame - label columns are added
+            empty_review_size += init_chunk_size - chunk_df.shape[0]
+            review_length_histogram.update(chunk_df['review_length'].values)
+
+            failure_df = chunk_df[chunk_df['Tagging'] == 'Bad']
+            failure_size += failure_df.shape[0]
+            failure_type_amount_counter.update(failure_df['Reason'].value_counts().to_dict())
+
+            # b. + c. label columns, e. compact dtypes (d. check duplication is not supported in streaming mode)
+            self._add_label_columns(chunk_df)
+            apply_dtype_policy(chunk_df)
+            chunk_df.to_csv(file_path, mode='a', header=chunk_num == 0)
+            columnar_writer.append(chunk_df)
+            self.clean_rows += chunk_df.shape[0]
+
+        columnar_writer.close(file_path)
+        self.input_rows = data_size
+
+        self.logging.info('')
+        self.logging.info('data size: ' + str(data_size))
+        self._log_target_column(dict(tag_amount_counter), data_size)
+
+        self.logging.info('')
+        self.logging.info('Reviews analysis')
+        self.logging.info('Reviews deleted because size=0: ' + str(empty_review_size))
+        self.logging.info('')
+        review_statistic_dict = review_length_histogram.statistic()
+        self._log_review_statistic(review_statistic_dict)
+        review_length_value, review_length_amount = review_length_histogram.nonzero_bins()
+        self._plot_review_length_histogram(review_length_value, review_statistic_dict['max'],
+                                           weights=review_length_amount)
+
+        self._log_reason_failure(dict(failure_type_amount_counter), failure_size)
+
+        self.logging.info('')
+        self.logging.info('save clean df: ' + file_path)
+        self.logging.info('save clean columnar df: ' + get_store_dir(file_path))
+        return
 
-        logging.info('')
-        logging.info('save clean df: ' + file_path)
+    # near-duplicate reviews (MinHash signatures + LSH bands), duplicates leak between CV folds
+    # mode 'drop' - keep the first review of every cluster, 'tag' - add duplicate_cluster/is_duplicate columns
+    def check_duplication(self):
+
+        from near_duplicate import NearDuplicateDetector, cluster_statistic
+
+        dedup_dict = self.dedup_configuration_dict
+        self.logging.info('')
+        self.logging.info('check duplication: ' + str(dedup_dict))
+
+        detector = NearDuplicateDetector(shingle_size=dedup_dict['shingle_size'],
+                                         num_perm=dedup_dict['num_perm'],
+                                         num_bands=dedup_dict['num_bands'],
+                                         threshold=dedup_dict['threshold'],
+                                         seed=dedup_dict['seed'])
+        cluster_id = detector.find_clusters(self.data_set_df['Review'])
+        is_duplicate = cluster_id != np.arange(len(cluster_id))
+
+        statistic_dict = cluster_statistic(cluster_id)
+        self.logging.info('duplicate clusters: ' + str(statistic_dict['duplicate_clusters']) +
+                     ', duplicate reviews: ' + str(statistic_dict['duplicate_reviews']) +
+                     ', max cluster size: ' + str(statistic_dict['max_cluster_size']))
+        self.logging.info('cluster size -> amount: ' + str(statistic_dict['cluster_size_amount']))
+
+        # clusters with different review tag - duplicates with contradicting labels
+        tag_per_cluster = pd.Series(self.data_set_df['review_tag'].values).groupby(cluster_id).nunique()
+        self.logging.info('duplicate clusters with contradicting review tag: ' + str(int((tag_per_cluster > 1).sum())))
+
+        if dedup_dict['mode'] == 'drop':
+            self.data_set_df = self.data_set_df[~is_duplicate]
+            self.logging.info('reviews deleted because duplicate: ' + str(int(is_duplicate.sum())))
+        elif dedup_dict['mode'] == 'tag':
+            # cluster id = index label of the first review in the cluster
+            self.data_set_df['duplicate_cluster'] = self.data_set_df.index.values[cluster_id]
+            self.data_set_df['is_duplicate'] = is_duplicate.astype(np.int8)
+        else:
+            raise ValueError('unknown dedup mode: ' + str(dedup_dict['mode']))
         return
 
+    def _get_clean_file_path(self):
+        return self.output_clean_folder + 'clean_data_multi_new_' + str(self.vertical_type) + '.csv'
+
+    @staticmethod
+    def _add_label_columns(data_set_df):
+        """
+        add label columns in place:
+            review_tag - Bad -> 0, otherwise 1
+            one vs. all binary column for every reason in INDICATOR_COLUMN_CLASS
+            failure_reason - failure reason class, 12 for good review (nan reason)
+        """
+        data_set_df['review_tag'] = np.where(data_set_df['Tagging'] == 'Bad', 0, 1)   # good - 1, bad - 0
+
+        failure_reason = CleanData._reason_class_codes(data_set_df['Reason'])
+
+        # all binary columns from the failure reason codes in one step
+        indicator_class = np.array([class_id for _, class_id in INDICATOR_COLUMN_CLASS])
+        indicator_matrix = (failure_reason[:, np.newaxis] == indicator_class).astype(np.int64)
+        for idx, (column_name, _) in enumerate(INDICATOR_COLUMN_CLASS):
+            data_set_df[column_name] = indicator_matrix[:, idx]
+
+        data_set_df['failure_reason'] = failure_reason.astype(np.float64)
+        return data_set_df
+
     @staticmethod
-    def _reason_class_mapping(reason):
-
-        def find_class(reason):        # relative to -7 (server in USA)
-            return {
-                'Subjective sentence': 0,
-                'Missing context': 1,
-                'Refers to a specific listing aspect': 2,
-                'Non-informative sentence ': 3,
-                'Non-informative sentence': 3,
-                'Poor language (spelling mistakes)': 4,
-                'poor language (spelling mistakes)': 4,
-                'Purely negative sentence ': 5,
-                'Purely negative sentence': 5,
-                'Expresses explicit doubt': 6,
-                'Refers to the description': 7,
-                'refers to the description': 7,
-                'Too detailed': 8,
-                'too detailed': 8,
-                'Other (please explain in comments column)': 9,
-                'Offensive language': 10,
-                'Too specific/narrow': 11,
-                'too specific/narrow': 11
-                # nan - 12 - good review
-            }[reason]
-
-        cur_class = find_class(reason=reason)
-        return cur_class
-
-
-def main(input_data_file, vertical_type, output_clean_folder):
-
-    clean_data_obj = CleanData(input_data_file, vertical_type, output_clean_folder)
+    def _reason_class_codes(reason_series):
+        """
+        map Reason to failure reason class (index in REASON_CLASS_LIST)
+        every distinct reason is normalized (strip + lower case) only once, rows are mapped by their factorize code
+        :return: int numpy array aligned to reason_series, nan/non-string reason -> GOOD_REVIEW_CLASS
+        """
+        reason_codes, reason_uniques = pd.factorize(reason_series)      # nan -> -1
+        normalized_uniques = pd.Series(reason_uniques, dtype=object).str.strip().str.lower()
+
+        unique_class = pd.Categorical(normalized_uniques, categories=REASON_CLASS_LIST).codes.astype(np.int64)
+        unknown_reason = (unique_class == -1) & normalized_uniques.notnull().values
+        if unknown_reason.any():
+            raise ValueError('unknown failure reason: ' + str(list(normalized_uniques[unknown_reason])))
+
+        # last entry is used for factorize code -1 (nan reason)
+        class_table = np.append(np.where(unique_class == -1, GOOD_REVIEW_CLASS, unique_class), GOOD_REVIEW_CLASS)
+        return class_table[reason_codes]
+
+
+def main(input_data_file, vertical_type, output_clean_folder, chunk_size=None, dedup_configuration_dict=None,
+         logger=None):
+
+    clean_data_obj = CleanData(input_data_file, vertical_type, output_clean_folder, chunk_size,
+                               dedup_configuration_dict, logger)
 
     clean_data_obj.init_debug_log()                         # init log file
-    clean_data_obj.load_clean_csv_results()                 # load data set
-    clean_data_obj.statistical_data()                       # analyze data and save statistical data
-    clean_data_obj.clean_df()                               # clean df - e.g. remain valid users only
+    if chunk_size is not None:
+        clean_data_obj.stream_clean_csv_results()           # load, analyze and clean chunk by chunk
+    else:
+        clean_data_obj.load_clean_csv_results()             # load data set
+        clean_data_obj.statistical_data()                   # analyze data and save statistical data
+        clean_data_obj.clean_df()                           # clean df - e.g. remain valid users only
+
+    return clean_data_obj
+
+
+# clean one vertical in a pool worker (module level function - must be picklable)
+# every worker process cleans a single vertical (maxtasksperchild=1) with its own named logger and log file
+def _clean_vertical_worker(args):
+
+    import os
+    import time
+    entry_idx, vertical_type, input_data_file, output_clean_folder, chunk_size, dedup_configuration_dict = args
+
+    # entry index in the name - the same vertical can be listed twice
+    logger = logging.getLogger('clean_data.' + str(entry_idx) + '.' + str(vertical_type))
+
+    start_time = time.time()
+    summary_dict = {
+        'vertical': vertical_type,
+        'input_file': input_data_file,
+        'pid': os.getpid(),
+        'input_rows': None,
+        'clean_rows': None,
+        'time_sec': None,
+        'status': 'ok'
+    }
+    try:
+        clean_data_obj = main(input_data_file, vertical_type, output_clean_folder, chunk_size,
+                              dedup_configuration_dict, logger)
+        summary_dict['input_rows'] = clean_data_obj.input_rows
+        summary_dict['clean_rows'] = clean_data_obj.clean_rows
+    except Exception as e:
+        # one failed vertical does not stop the others
+        logger.exception('clean vertical failed: ' + str(vertical_type))
+        summary_dict['status'] = 'failed: ' + repr(e)
+    finally:
+        for handler in list(logger.handlers):
+            handler.close()
+            logger.removeHandler(handler)
+
+    summary_dict['time_sec'] = round(time.time() - start_time, 3)
+    return summary_dict
+
+
+def main_batch(vertical_input_list, output_clean_folder, chunk_size=None, dedup_configuration_dict=None,
+               num_workers=None):
+    """
+    clean several verticals at the same time, each vertical in its own process
+    :param vertical_input_list: list of (vertical_type, input_data_file) pairs
+    :param num_workers: None - one process per vertical (bounded by cpu count)
+    :return: summary df - vertical, input/clean rows, time, status
+    """
+    import time
+    import multiprocessing
+
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = max(1, min(num_workers, len(vertical_input_list)))
+
+    args_list = [(entry_idx, vertical_type, input_data_file, output_clean_folder, chunk_size, dedup_configuration_dict)
+                 for entry_idx, (vertical_type, input_data_file) in enumerate(vertical_input_list)]
+
+    start_time = time.time()
+    pool = multiprocessing.Pool(processes=num_workers, maxtasksperchild=1)
+    try:
+        summary_list = pool.map(_clean_vertical_worker, args_list, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    summary_df = pd.DataFrame(summary_list, columns=['vertical', 'input_file', 'pid', 'input_rows', 'clean_rows',
+                                                     'time_sec', 'status'])
+    print('clean ' + str(len(vertical_input_list)) + ' verticals, workers: ' + str(num_workers) +
+          ', total time: ' + str(round(time.time() - start_time, 3)) + ' sec')
+    print(summary_df.to_string(index=False))
+    return summary_df
 
 
 if __name__ == '__main__':
@@ -293,6 +565,7 @@ if __name__ == '__main__':
     # input file name
     vertical_type = 'motors'   # 'fashion'/'motors'
     output_clean_folder = '../data/clean/'
+    chunk_size = None           # None - in memory, e.g. 200000 - streaming mode (bounded memory for large dumps)
     if vertical_type == 'fashion':
         input_data_file = '../data/25K_amazon_fashion.csv'
     elif vertical_type == 'motors':
@@ -300,4 +573,26 @@ if __name__ == '__main__':
     else:
         raise()
 
-    main(input_data_file, vertical_type, output_clean_folder)
\ No newline at end of file
+    # batch mode - clean all (vertical, input csv) pairs in parallel, one process and one log file per vertical
+    batch_bool = False
+    num_workers = None          # None - one process per vertical (bounded by cpu count)
+    vertical_input_list = [
+        ('fashion', '../data/25K_amazon_fashion.csv'),
+        ('motors', '../data/25K_amazon_motors.csv')
+    ]
+
+    # near-duplicate reviews (in memory mode only)
+    dedup_configuration_dict = {
+        'dedup_bool': True,
+        'mode': 'drop',             # 'drop' - keep first review of a cluster, 'tag' - add cluster columns
+        'shingle_size': 3,          # tokens per shingle
+        'num_perm': 128,            # MinHash signature length
+        'num_bands': 16,            # LSH bands (8 rows each)
+        'threshold': 0.8,           # min estimated Jaccard similarity of near-duplicates
+        'seed': 0
+    }
+
+    if batch_bool:
+        main_batch(vertical_input_list, output_clean_folder, chunk_size, dedup_configuration_dict, num_workers)
+    else:
+        main(input_data_file, vertical_type, output_clean_folder, chunk_size, dedup_configuration_dict)
\ No newline at end of file
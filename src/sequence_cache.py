@@ -0,0 +1,120 @@
+from __future__ import print_function
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+# tokenized folds of the classifier, shared by all grid configurations of the same data, folds, tokenizer and maxlen
+#     <cache_dir>/<key>/word_index.pkl - fitted word_index (train texts of the fold), None - word_index of the
+#                                        pre-trained vocabulary ('pretrained' index mode, not stored per fold)
+#     <cache_dir>/<key>/x_train.npy    - int32 (n train, maxlen) padded sequences, opened with np.load(mmap_mode='r')
+#     <cache_dir>/<key>/x_test.npy     - int32 (n test, maxlen) padded sequences
+# key - md5 of the train/test texts (content and order, i.e. data set and fold indices) and the tokenizer settings
+# entries are reused only with fixed folds (cv seed), prune_cache drops the least recently used entries above a size
+# cap and entries older than an age cap (entry directory mtime - updated on every cache hit)
+
+WORD_INDEX_FILE_NAME = 'word_index.pkl'
+X_TRAIN_FILE_NAME = 'x_train.npy'
+X_TEST_FILE_NAME = 'x_test.npy'
+
+# default caps of prune_cache
+MAX_CACHE_MB = 10240
+MAX_ENTRY_AGE_DAYS = 30
+
+
+def cache_key(x_train, x_test, settings_dict):
+    """
+    :param x_train: train texts of the fold (series/list of str)
+    :param x_test: test texts of the fold
+    :param settings_dict: tokenizer settings and maxlen (json serializable)
+    """
+    md5 = hashlib.md5()
+    md5.update(json.dumps(settings_dict, sort_keys=True).encode('utf-8'))
+    for texts in [x_train, x_test]:
+        text_hash = pd.util.hash_array(np.asarray(list(texts), dtype=object))
+        md5.update(np.int64(len(text_hash)).tobytes())
+        md5.update(text_hash.tobytes())
+    return md5.hexdigest()
+
+
+def cache_exists(cache_dir, key):
+    return os.path.exists(os.path.join(cache_dir, key, X_TEST_FILE_NAME))
+
+
+def save_sequences(cache_dir, key, word_index, x_train, x_test):
+    """
+    files are written to a temporary directory and renamed (another configuration which reads the cache at the same
+    time never sees a partial entry), if another process renamed its entry first - its entry is used
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    tmp_dir = entry_dir + '.tmp' + str(os.getpid())
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    with open(os.path.join(tmp_dir, WORD_INDEX_FILE_NAME), 'wb') as f:
+        pickle.dump(word_index, f, protocol=2)      # protocol 2 - readable by python 2 and 3
+    np.save(os.path.join(tmp_dir, X_TRAIN_FILE_NAME), np.asarray(x_train, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, X_TEST_FILE_NAME), np.asarray(x_test, dtype=np.int32))
+
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # entry written meanwhile by another process (rename of a directory fails on an existing non-empty
+        # directory) - keep the existing entry
+        shutil.rmtree(tmp_dir)
+        if not cache_exists(cache_dir, key):
+            raise
+    return
+
+
+def load_sequences(cache_dir, key, mmap_mode='r'):
+    """ :return: word_index, x_train, x_test (memory-mapped, mmap_mode=None - read into memory) """
+    entry_dir = os.path.join(cache_dir, key)
+    with open(os.path.join(entry_dir, WORD_INDEX_FILE_NAME), 'rb') as f:
+        word_index = pickle.load(f)
+    x_train = np.load(os.path.join(entry_dir, X_TRAIN_FILE_NAME), mmap_mode=mmap_mode)
+    x_test = np.load(os.path.join(entry_dir, X_TEST_FILE_NAME), mmap_mode=mmap_mode)
+    os.utime(entry_dir, None)       # recently used (prune_cache)
+    return word_index, x_train, x_test
+
+
+def prune_cache(cache_dir, max_mb=MAX_CACHE_MB, max_age_days=MAX_ENTRY_AGE_DAYS, keep_key=None):
+    """
+    remove entries older than max_age_days and the least recently used entries while the cache is above max_mb
+    (None - no cap), temporary directories of interrupted writes are removed after max_age_days as well
+    :param keep_key: entry which is never removed (e.g. written right now)
+    :return: removed entries, cache size (MB) after the prune
+    """
+    import time
+
+    entry_list = list()
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        if name == keep_key or not os.path.isdir(entry_dir):
+            continue
+        num_bytes = sum(os.path.getsize(os.path.join(entry_dir, file_name)) for file_name in os.listdir(entry_dir))
+        entry_list.append((os.path.getmtime(entry_dir), num_bytes, entry_dir))
+
+    keep_bytes = 0
+    if keep_key is not None and cache_exists(cache_dir, keep_key):
+        keep_dir = os.path.join(cache_dir, keep_key)
+        keep_bytes = sum(os.path.getsize(os.path.join(keep_dir, file_name)) for file_name in os.listdir(keep_dir))
+
+    min_mtime = time.time() - max_age_days * 24 * 3600 if max_age_days is not None else None
+    max_bytes = max_mb * 1024 * 1024 if max_mb is not None else None
+    cache_bytes = keep_bytes + sum(num_bytes for _, num_bytes, _ in entry_list)
+
+    removed = 0
+    for mtime, num_bytes, entry_dir in sorted(entry_list):      # least recently used first
+        is_old = min_mtime is not None and mtime < min_mtime
+        is_over_size = max_bytes is not None and cache_bytes > max_bytes
+        if not is_old and not is_over_size:
+            continue
+        shutil.rmtree(entry_dir, ignore_errors=True)        # e.g. removed meanwhile by another process
+        cache_bytes -= num_bytes
+        removed += 1
+    return removed, round(cache_bytes / (1024.0 * 1024.0), 2)
@@ -0,0 +1,79 @@
+from __future__ import print_function
+import os
+import numpy as np
+import pandas as pd
+
+from columnar_store import ColumnarWriter, get_store_dir, load_columnar, store_exists
+
+
+def _write_chunks(csv_path, store_dir, chunk_size):
+    """ stream the csv as stream_clean_csv_results does - chunks appended to a mirrored csv and the store """
+    clean_path = os.path.join(os.path.dirname(csv_path), 'clean_chunks.csv')
+    columnar_writer = ColumnarWriter(store_dir)
+    for chunk_num, chunk_df in enumerate(pd.read_csv(csv_path, chunksize=chunk_size)):
+        chunk_df.to_csv(clean_path, mode='a', header=chunk_num == 0, index=False)
+        columnar_writer.append(chunk_df)
+    columnar_writer.close()
+    return clean_path
+
+
+def test_column_dtype_drift_between_chunks(tmpdir):
+    # Comments - all nan in the first chunk (float64), text later; Rating - int64 first, nan later (float64)
+    csv_path = os.path.join(str(tmpdir), 'clean.csv')
+    pd.DataFrame({
+        'Review': ['review ' + str(i) for i in range(10)],
+        'Comments': [np.nan] * 4 + ['too short', np.nan, 'ok', u'caf\xe9', np.nan, '1'],
+        'Rating': [1, 2, 3, 4, 5, np.nan, 7, 8, 9, 10],
+        'Score': [0.5] * 10
+    }).to_csv(csv_path, index=False)
+
+    store_dir = os.path.join(str(tmpdir), 'clean_columnar')
+    clean_path = _write_chunks(csv_path, store_dir, chunk_size=4)
+
+    expected_df = pd.read_csv(clean_path)
+    loaded_df = load_columnar(store_dir)
+    assert loaded_df['Comments'].dtype == object
+    assert loaded_df['Rating'].dtype == np.float64
+    pd.testing.assert_frame_equal(loaded_df, expected_df)
+
+
+def test_numeric_chunk_of_string_column(tmpdir):
+    # Comments - text in the first chunk, all nan later
+    csv_path = os.path.join(str(tmpdir), 'clean.csv')
+    pd.DataFrame({
+        'Review': ['review ' + str(i) for i in range(6)],
+        'Comments': ['a', 'b', 'c', np.nan, np.nan, np.nan]
+    }).to_csv(csv_path, index=False)
+
+    store_dir = os.path.join(str(tmpdir), 'clean_columnar')
+    clean_path = _write_chunks(csv_path, store_dir, chunk_size=3)
+
+    pd.testing.assert_frame_equal(load_columnar(store_dir), pd.read_csv(clean_path))
+
+
+def test_store_of_an_older_csv_is_stale(tmpdir):
+    csv_path = os.path.join(str(tmpdir), 'clean.csv')
+    store_dir = get_store_dir(csv_path)
+    df = pd.DataFrame({'Review': ['a', 'b'], 'review_tag': np.array([0, 1], dtype=np.int8)})
+    df.to_csv(csv_path)
+    columnar_writer = ColumnarWriter(store_dir)
+    columnar_writer.append(df)
+    columnar_writer.close(csv_path)
+    assert store_exists(store_dir, csv_path)
+
+    # csv cleaned again (store not written)
+    df.iloc[:1].to_csv(csv_path)
+    assert store_exists(store_dir)
+    assert not store_exists(store_dir, csv_path)
+
+
+def test_numeric_columns_stay_memory_mapped(tmpdir):
+    store_dir = os.path.join(str(tmpdir), 'clean_columnar')
+    columnar_writer = ColumnarWriter(store_dir)
+    columnar_writer.append(pd.DataFrame({'review_tag': np.arange(10, dtype=np.int8), 'Review': ['a'] * 10}))
+    columnar_writer.close()
+
+    loaded_df = load_columnar(store_dir)
+    assert isinstance(loaded_df['review_tag'].values.base, np.memmap)
+    loaded_df.loc[0, 'review_tag'] = 5          # copy-on-write - the store is not changed
+    assert load_columnar(store_dir)['review_tag'].iloc[0] == 0
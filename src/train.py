@@ -88,13 +88,52 @@ class TrainModel:
 
     ########################################## load data and prepare it ##########################################
 
-    # load csv into df
+    # load clean df - only the columns used by the model
+    # use the typed columnar copy written by CleanData if exists and was written from the current csv, otherwise parse
+    # the csv
     def load_clean_csv_results(self):
 
-        self.df = pd.read_csv(self.input_data_file)
+        import time
+        from columnar_store import get_store_dir, store_exists, load_columnar
+        from dtype_policy import apply_dtype_policy, memory_usage_mb
 
+        start_time = time.time()
+        columns = self._get_model_columns()
+        store_dir = get_store_dir(self.input_data_file)
+
+        if store_exists(store_dir, self.input_data_file):
+            self.df = load_columnar(store_dir, columns)
+            load_type = 'columnar'
+        else:
+            if store_exists(store_dir):
+                self.logging.info('columnar df is stale (csv written again after the store) - load csv')
+            self.df = pd.read_csv(self.input_data_file, usecols=columns)
+            load_type = 'csv'
+
+        self.logging.info('load clean df ({}): {} rows, columns: {}, time: {} sec'.format(
+            load_type, self.df.shape[0], columns, round(time.time() - start_time, 3)))
+
+        # compact dtypes - every fold slices self.df, int8/categorical columns avoid object copies
+        memory_before = memory_usage_mb(self.df)
+        apply_dtype_policy(self.df)
+        self.logging.info('df memory usage (deep): {} MB -> {} MB after dtype policy'.format(
+            memory_before, memory_usage_mb(self.df)))
         return
 
+    # x, y (single/multi class) and failure reason columns
+    def _get_model_columns(self):
+
+        columns = [self.df_configuration_dict['x_column'], self.df_configuration_dict['y_column']]
+        if self.multi_class_configuration_dict['multi_class_bool']:
+            columns += self.multi_class_configuration_dict['multi_class_label']
+        columns.append('Reason')
+
+        model_columns = list()
+        for column_name in columns:
+            if column_name not in model_columns:
+                model_columns.append(column_name)
+        return model_columns
+
     # df pre-processing
     # change target column to 1-0 (target columns is defined from wrapper_train)
     # after current function, data is ready to split and build LSTM network
@@ -108,7 +147,8 @@ class TrainModel:
         # one vs. all method
         # change positive group to 1, otherwise to 0
         self.df[self.df_configuration_dict['y_column']] = np.where(
-            self.df[self.df_configuration_dict['y_column']] == self.df_configuration_dict['y_positive'], 1, 0)
+            self.df[self.df_configuration_dict['y_column']] == self.df_configuration_dict['y_positive'], 1, 0
+        ).astype(np.int8)
 
         # statistics on target feature (failure reason or good)
         self.logging.info('')
@@ -151,8 +191,18 @@ class TrainModel:
     def _lstm_model_cv(self):
 
         from sklearn.model_selection import StratifiedKFold
-
-        stratified_kfold = StratifiedKFold(n_splits=self.cv_configuration['num_fold'], shuffle=True)
+        from embedding_store import set_embedding_matrix_cache_size
+
+        # fixed seed - same folds for every grid configuration (tokenized folds are cached by the classifier)
+        # no seed (older configurations) - random folds
+        # embedding matrix per fold is kept for the next configuration (None - num_fold), random folds never repeat
+        matrix_cache_size = self.cv_configuration.get('embedding_matrix_cache_size')
+        if matrix_cache_size is None:
+            fixed_folds = self.cv_configuration.get('seed') is not None
+            matrix_cache_size = self.cv_configuration['num_fold'] if fixed_folds else 0
+        set_embedding_matrix_cache_size(matrix_cache_size)
+        stratified_kfold = StratifiedKFold(n_splits=self.cv_configuration['num_fold'], shuffle=True,
+                                           random_state=self.cv_configuration.get('seed'))
         fold_counter = 1
 
         # iterate over each one of the folds
@@ -166,43 +216,37 @@ class TrainModel:
             logging.info('split CV: {}'.format(str(fold_counter)))
             logging.info('')
             logging.info('test indices: {}'.format(str(test[:10])))
-            logging.info('train size=' + str(self.df[self.df_configuration_dict['y_column']][train].shape[0]) +
-                         ', ratio_good=' + str(
-                round(self.df[self.df_configuration_dict['y_column']][train].mean(), 3)) +
-                         ', majority=' + str(
-                1 - round(self.df[self.df_configuration_dict['y_column']][train].mean(), 3)))
 
-            logging.info('test size=' + str(self.df[self.df_configuration_dict['y_column']][test].shape[0]) +
-                         ', ratio_good=' + str(
-                round(self.df[self.df_configuration_dict['y_column']][test].mean(), 3)) +
-                         ', majority=' + str(
-                1 - round(self.df[self.df_configuration_dict['y_column']][test].mean(), 3)))
+            # positional slices (iloc) - int8/categorical columns are copied as small arrays, not python objects
+            y_column_train = self.df[self.df_configuration_dict['y_column']].iloc[train]
+            y_column_test = self.df[self.df_configuration_dict['y_column']].iloc[test]
+
+            logging.info('train size=' + str(y_column_train.shape[0]) +
+                         ', ratio_good=' + str(round(y_column_train.mean(), 3)) +
+                         ', majority=' + str(1 - round(y_column_train.mean(), 3)))
 
-            x_train = self.df[self.df_configuration_dict['x_column']][train]
+            logging.info('test size=' + str(y_column_test.shape[0]) +
+                         ', ratio_good=' + str(round(y_column_test.mean(), 3)) +
+                         ', majority=' + str(1 - round(y_column_test.mean(), 3)))
+
+            x_train = self.df[self.df_configuration_dict['x_column']].iloc[train]
+            x_test = self.df[self.df_configuration_dict['x_column']].iloc[test]
 
             # using MTL
             if self.multi_class_configuration_dict['multi_class_bool']:
-                y_train_df = \
-                self.df[self.multi_class_configuration_dict['multi_class_label']].iloc[train]
                 y_train = []
+                y_test = []
                 for class_name in self.multi_class_configuration_dict['multi_class_label']:
-                    y_train.append(y_train_df[class_name])
+                    y_train.append(self.df[class_name].iloc[train])
+                    y_test.append(self.df[class_name].iloc[test])
 
             # MTL is false
             else:
-                y_train = self.df[self.df_configuration_dict['y_column']][train]
-
-            x_test = self.df[self.df_configuration_dict['x_column']][test]
-            if self.multi_class_configuration_dict['multi_class_bool']:
-                y_test_df = self.df[self.multi_class_configuration_dict['multi_class_label']].iloc[test]
-                y_test = []
-                for class_name in self.multi_class_configuration_dict['multi_class_label']:
-                    y_test.append(y_test_df[class_name])
-            else:
-                y_test = self.df[self.df_configuration_dict['y_column']][test]
+                y_train = y_column_train
+                y_test = y_column_test
 
-            train_reason = self.df['Reason'][train]
-            test_reason = self.df['Reason'][test]
+            train_reason = self.df['Reason'].iloc[train]
+            test_reason = self.df['Reason'].iloc[test]
 
             logging.info('')
             logging.info('')
@@ -1,8 +1,413 @@
 from __future__ import print_function
 import os
+import re
+import time
 import logging
+import numpy as np
 import pandas as pd
 import gensim
+from gensim.models.callbacks import CallbackAny2Vec
+
+# characters removed from the value part of a crawl review
+CRAWL_STRIP_REGEX = re.compile(r'[{}=]')
+
+# crawl csv -> vertical routing, list order = order of the reviews in the vertical data set
+# rule: (first row, end row) - row range of the csv [first, end), None - open range
+#       or function(review series of a chunk) -> boolean mask (predicate)
+CRAWL_ROUTE_LIST = [
+    ('../data/word2vec_input_data/fashion/amazon-crawl-output.csv', 'fashion', (None, None)),
+    ('../data/word2vec_input_data/fashion/amazon-crawl-output-2.csv', 'fashion', (None, 343789)),
+    ('../data/word2vec_input_data/fashion/amazon-crawl-output-3.csv', 'motors', (None, None)),
+    ('../data/word2vec_input_data/fashion/amazon-crawl-output-2.csv', 'motors', (343790, None)),
+]
+
+
+def parse_crawl_reviews(review_series):
+    """
+    crawl format "{KEY=[value]}" -> "value", single pass over the REVIEWS column (source series is not changed)
+    same output as the per-review parsing: remove braces, keep the text after the first '=' without any '=',
+    drop first and last character. reviews that are not a str (e.g. nan) are rejected
+    :return: list of parsed reviews (input order), amount of rejected reviews
+    """
+    review_list = list()
+    rejected_amount = 0
+    for review in review_series.values:
+        if not isinstance(review, basestring):
+            rejected_amount += 1
+            continue
+
+        # trailing braces are the common case - the regex runs only when '{', '}' or '=' remain inside the value
+        value = review.partition('=')[2].rstrip('}')
+        if '{' in value or '}' in value or '=' in value:
+            value = CRAWL_STRIP_REGEX.sub('', value)
+        review_list.append(value[1:-1])
+
+    return review_list, rejected_amount
+
+
+def route_crawl_csv(route_list, output_dir, chunk_size):
+    """
+    read every source csv once (REVIEWS column only, chunk by chunk) and append the parsed reviews of each chunk to
+    the file of every route whose rule select them (<output_dir>/<vertical>/route_<idx>.tmp, review per line)
+    memory is bounded by the chunk size
+    :return: dict vertical -> list of route files (route list order), dict vertical -> rejected amount
+    """
+    rejected_dict = dict((vertical, 0) for _, vertical, _ in route_list)
+    route_amount_list = [0] * len(route_list)      # parsed reviews per route
+
+    route_path_list = list()
+    for idx, (_, vertical, _) in enumerate(route_list):
+        vertical_dir = os.path.join(output_dir, str(vertical))
+        if not os.path.exists(vertical_dir):
+            os.makedirs(vertical_dir)
+        route_path_list.append(os.path.join(vertical_dir, 'route_' + str(idx) + '.tmp'))
+
+    source_list = list()
+    for source_csv, _, _ in route_list:
+        if source_csv not in source_list:
+            source_list.append(source_csv)
+
+    route_file_list = [open(route_path, 'wb') for route_path in route_path_list]
+    try:
+        for source_csv in source_list:
+            route_idx_list = [idx for idx, route in enumerate(route_list) if route[0] == source_csv]
+            num_rows = 0
+            for chunk_df in pd.read_csv(source_csv, usecols=['REVIEWS'], dtype={'REVIEWS': object},
+                                        chunksize=chunk_size):
+                review_series = chunk_df['REVIEWS']
+                for route_idx in route_idx_list:
+                    _, vertical, rule = route_list[route_idx]
+                    route_review_series = review_series[_route_mask(rule, num_rows, review_series)]
+                    parsed_list, rejected_amount = parse_crawl_reviews(route_review_series)
+                    route_file_list[route_idx].write(b''.join(_review_to_line(review) for review in parsed_list))
+                    route_amount_list[route_idx] += len(parsed_list)
+                    rejected_dict[vertical] += rejected_amount
+                num_rows += review_series.shape[0]
+
+            print('route crawl csv: ' + str(source_csv) + ', rows: ' + str(num_rows))
+    finally:
+        for route_file in route_file_list:
+            route_file.close()
+
+    route_file_dict = dict()
+    for (source_csv, vertical, rule), route_path, route_amount in zip(route_list, route_path_list,
+                                                                      route_amount_list):
+        print('route: ' + str(source_csv) + ' -> ' + str(vertical) + ', rule: ' + str(rule) +
+              ', reviews: ' + str(route_amount))
+        route_file_dict.setdefault(vertical, list()).append(route_path)
+    return route_file_dict, rejected_dict
+
+
+def iter_review_chunks(path_list, chunk_size):
+    """ reviews of review files (review per line) in file order, as lists of at most chunk_size reviews """
+    review_chunk = list()
+    for path in path_list:
+        with open(path, 'rb') as f:
+            for line in f:
+                review_chunk.append(_line_to_review(line))
+                if len(review_chunk) >= chunk_size:
+                    yield review_chunk
+                    review_chunk = list()
+    if review_chunk:
+        yield review_chunk
+
+
+def write_review_file(reviews, path):
+    """ raw reviews data set - review per line (utf-8), :return: number of reviews """
+    num_reviews = 0
+    with open(path, 'wb') as f:
+        for review in reviews:
+            f.write(_review_to_line(review))
+            num_reviews += 1
+    return num_reviews
+
+
+def _review_to_line(review):
+    """ review -> utf-8 line of a review file, line breaks inside the review are replaced by a space """
+    if not isinstance(review, bytes):
+        review = review.encode('utf-8')
+    return review.replace(b'\n', b' ') + b'\n'
+
+
+def _line_to_review(line):
+    # python 2 - keep byte str (same as pd.read_csv), python 3 - decode
+    review = line[:-1] if line.endswith(b'\n') else line
+    return review if str is bytes else review.decode('utf-8')
+
+
+def _route_mask(rule, chunk_first_row, review_series):
+    """ boolean mask of the chunk rows selected by a row range or a predicate rule """
+    if callable(rule):
+        return np.asarray(rule(review_series), dtype=bool)
+
+    first_row, end_row = rule
+    row_position = np.arange(chunk_first_row, chunk_first_row + review_series.shape[0])
+    mask = np.ones(review_series.shape[0], dtype=bool)
+    if first_row is not None:
+        mask &= row_position >= first_row
+    if end_row is not None:
+        mask &= row_position < end_row
+    return mask
+
+
+def dedup_reviews(review_chunks, dedup_dict):
+    """
+    drop exact duplicate reviews from a stream of review chunks (first occurrence is kept, order is kept)
+    review is normalized (lower case, single spaces) and hashed to 64 bits, seen hashes are kept in a sorted
+    uint64 array (8 bytes per unique review)
+    :param review_chunks: iterable of review lists (e.g. iter_review_chunks)
+    :param dedup_dict: filled with the dedup statistic as the stream is consumed (complete when it is exhausted)
+    :return: generator of unique review lists (one per chunk)
+    """
+    from sketches import SortedHashSet, hash_tokens
+
+    seen_hash_set = SortedHashSet()
+    dedup_dict.update({'reviews': 0, 'unique_reviews': 0, 'duplicate_reviews': 0, 'dedup_ratio': 0.0,
+                       'tokens': 0, 'duplicate_tokens': 0, 'duplicate_token_ratio': 0.0})
+    for review_chunk in review_chunks:
+        normalized_list = [' '.join(review.lower().split()) for review in review_chunk]
+        token_amount = np.array([len(normalized) and normalized.count(' ') + 1 for normalized in normalized_list],
+                                dtype=np.int64)
+
+        is_new = seen_hash_set.add(hash_tokens(normalized_list))
+        unique_review_list = [review for review, new in zip(review_chunk, is_new) if new]
+
+        dedup_dict['reviews'] += len(review_chunk)
+        dedup_dict['unique_reviews'] += len(unique_review_list)
+        dedup_dict['duplicate_reviews'] = dedup_dict['reviews'] - dedup_dict['unique_reviews']
+        dedup_dict['tokens'] += int(token_amount.sum())
+        dedup_dict['duplicate_tokens'] += int(token_amount[~is_new].sum())
+        dedup_dict['dedup_ratio'] = round(dedup_dict['duplicate_reviews'] / float(max(dedup_dict['reviews'], 1)), 4)
+        dedup_dict['duplicate_token_ratio'] = round(dedup_dict['duplicate_tokens'] /
+                                                    float(max(dedup_dict['tokens'], 1)), 4)
+        yield unique_review_list
+
+
+def get_dedup_path(data_path):
+    """ dedup statistic of a data set: <n>.txt / <n>_corpus.txt -> <n>_dedup.json """
+    return re.sub(r'(_corpus)?\.txt$', '', data_path) + '_dedup.json'
+
+
+# chunk functions run in pool workers (module level functions - must be picklable)
+def _tokenize_review_chunk(review_list):
+    return [gensim.utils.simple_preprocess(line) for line in review_list]
+
+
+def parallel_chunk_map(chunk_function, item_list, num_workers, chunk_size):
+    """
+    apply chunk_function on consecutive chunks of item_list (list or iterable) in a process pool, yield chunk results
+    in input order. at most 2 chunks per worker are in flight - memory does not grow with the size of item_list
+    num_workers <= 1 - run in the current process
+    """
+    if num_workers <= 1:
+        for chunk in _iter_chunks(item_list, chunk_size):
+            yield chunk_function(chunk)
+        return
+
+    import multiprocessing
+    from collections import deque
+
+    pool = multiprocessing.Pool(processes=num_workers)
+    try:
+        pending_results = deque()
+        for chunk in _iter_chunks(item_list, chunk_size):
+            pending_results.append(pool.apply_async(chunk_function, (chunk,)))
+            if len(pending_results) >= 2 * num_workers:
+                yield pending_results.popleft().get()
+        while pending_results:
+            yield pending_results.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _iter_chunks(item_list, chunk_size):
+    """ consecutive lists of at most chunk_size items of a list or an iterable """
+    import itertools
+    item_iter = iter(item_list)
+    while True:
+        chunk = list(itertools.islice(item_iter, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_line_sentence_corpus(review_list, corpus_path, workers=1, chunk_size=10000):
+    """
+    pre-tokenized corpus for gensim corpus_file mode - one review per line, tokens separated by a space (utf-8)
+    review_list - list or iterable of reviews (streamed chunk by chunk)
+    a review without tokens is an empty line (number of lines = number of reviews)
+    :return: number of reviews, number of tokens
+    """
+    import io
+
+    num_reviews = 0
+    num_tokens = 0
+    with io.open(corpus_path, 'w', encoding='utf-8') as f:
+        for token_list_chunk in parallel_chunk_map(_tokenize_review_chunk, review_list, workers, chunk_size):
+            f.write(u''.join(u' '.join(token_list) + u'\n' for token_list in token_list_chunk))
+            num_reviews += len(token_list_chunk)
+            num_tokens += sum(len(token_list) for token_list in token_list_chunk)
+    return num_reviews, num_tokens
+
+
+class ReviewCorpus(object):
+    """
+    restartable iterable of tokenized reviews - gensim iterates the corpus once to build the vocabulary and once
+    per epoch. reviews are tokenized once when the corpus is created (chunk by chunk in a process pool, before
+    gensim starts its training threads) into a temporary line file, every pass reads the token lists from the file
+    instead of keeping a list of token lists of all reviews in memory
+    close() removes the temporary file
+    """
+
+    def __init__(self, review_list, log_every=None, workers=1, chunk_size=10000, token_dir=None):
+        import tempfile
+
+        self.log_every = log_every          # None - silent, int - print progress every log_every reviews
+        self.workers = workers              # tokenization processes (1 - current process)
+        self.chunk_size = chunk_size        # reviews per pool task
+        self.num_passes = 0
+
+        # token lists of the reviews, line per review (write_line_sentence_corpus), token_dir None - system temp dir
+        fd, self.token_path = tempfile.mkstemp(suffix='_tokens.txt', dir=token_dir)
+        os.close(fd)
+        start_time = time.time()
+        self.num_reviews, self.num_tokens = write_line_sentence_corpus(review_list, self.token_path, workers,
+                                                                       chunk_size)
+        if self.log_every is not None:
+            _log_throughput('tokenize', self.num_reviews, time.time() - start_time, self.workers)
+
+    def __iter__(self):
+        import io
+
+        self.num_passes += 1
+        next_log = 0
+        with io.open(self.token_path, 'r', encoding='utf-8') as f:
+            for num_reviews, line in enumerate(f):
+                if self.log_every is not None and num_reviews >= next_log:
+                    print('pass: ' + str(self.num_passes) + ', pre-process line: ' + str(num_reviews))
+                    next_log += self.log_every
+                yield line.split()
+
+    def __len__(self):
+        return self.num_reviews
+
+    def close(self):
+        if os.path.exists(self.token_path):
+            os.remove(self.token_path)
+
+
+# train one sweep combination in a pool worker (module level function - must be picklable)
+def _sweep_worker(args):
+
+    input_data_file, vertical_type, output_results_folder, word2vec_parameters_dict, vocab_path = args
+
+    start_time = time.time()
+    train_obj = TrainWord2Vec(input_data_file, vertical_type, output_results_folder, word2vec_parameters_dict)
+    word2vec_path = train_obj.run_word2vec_from_vocab(vocab_path)
+    return word2vec_path, round(time.time() - start_time, 3)
+
+
+def labelled_word_counts(review_series):
+    """ word -> amount over the reviews, words as the classifier tokenizer splits them (FastTokenizer) """
+    from collections import Counter
+    from fast_tokenizer import FastTokenizer
+
+    tokenizer = FastTokenizer()
+    word_counter = Counter()
+    for review in review_series.fillna('').values:
+        if not isinstance(review, basestring):
+            review = str(review)
+        word_counter.update(tokenizer.text_to_word_sequence(review))
+    return word_counter
+
+
+def _log_throughput(name, num_reviews, elapsed, workers):
+    logging.info(name + ': reviews: ' + str(num_reviews) + ', workers: ' + str(workers) +
+                 ', time: ' + str(round(elapsed, 3)) + ' sec' +
+                 ', reviews/sec: ' + str(int(num_reviews / max(elapsed, 1e-9))))
+
+
+class EpochMetricsCallback(CallbackAny2Vec):
+    """
+    gensim training callback - per epoch: loss, words/sec, elapsed time and ETA of the train call
+    loss - model must train with compute_loss=True, gensim loss is cumulative over a train call (epoch loss =
+    difference). words/sec counts the raw corpus words (model.corpus_total_words), effective words (after
+    down-sampling of frequent words) are known only at the end of a train call (add_train_summary)
+    one object is passed to every train call of a model (Word2Vec constructor, model.train)
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.epoch_list = list()        # dict per epoch
+        self.train_list = list()        # dict per train call (add_train_summary)
+        self.num_train_calls = 0
+        self.train_epochs = 0
+        self.train_epoch = 0
+        self.train_start_time = None
+        self.epoch_start_time = None
+        self.previous_loss = 0.0
+
+    def on_train_begin(self, model):
+        self.num_train_calls += 1
+        self.train_epochs = model.epochs
+        self.train_epoch = 0
+        self.train_start_time = time.time()
+        self.previous_loss = 0.0
+
+    def on_epoch_begin(self, model):
+        self.epoch_start_time = time.time()
+
+    def on_epoch_end(self, model):
+        epoch_time = time.time() - self.epoch_start_time
+        elapsed = time.time() - self.train_start_time
+        self.train_epoch += 1
+
+        loss = model.get_latest_training_loss()
+        epoch_loss = loss - self.previous_loss
+        self.previous_loss = loss
+
+        epoch_dict = {
+            'train_call': self.num_train_calls,
+            'epoch': self.train_epoch,
+            'epochs': self.train_epochs,
+            'loss': round(float(epoch_loss), 3),
+            'epoch_time': round(epoch_time, 3),
+            'elapsed': round(elapsed, 3),
+            'eta': round(elapsed / self.train_epoch * (self.train_epochs - self.train_epoch), 3),
+            'words_per_sec': int(model.corpus_total_words / max(epoch_time, 1e-9))
+        }
+        self.epoch_list.append(epoch_dict)
+        logging.info('word2vec train call: ' + str(self.num_train_calls) + ', epoch: ' + str(self.train_epoch) +
+                     '/' + str(self.train_epochs) + ', loss: ' + str(epoch_dict['loss']) +
+                     ', words/sec: ' + str(epoch_dict['words_per_sec']) + ', epoch time: ' +
+                     str(epoch_dict['epoch_time']) + ' sec, elapsed: ' + str(epoch_dict['elapsed']) +
+                     ' sec, eta: ' + str(epoch_dict['eta']) + ' sec')
+
+    def add_train_summary(self, train_result):
+        """ :param train_result: return value of model.train - (effective words, raw words) of all epochs """
+        effective_words, raw_words = train_result
+        elapsed = time.time() - self.train_start_time
+        train_dict = {
+            'train_call': self.num_train_calls,
+            'epochs': self.train_epochs,
+            'workers': self.workers,
+            'time': round(elapsed, 3),
+            'effective_words': int(effective_words),
+            'raw_words': int(raw_words),
+            'effective_words_per_sec': int(effective_words / max(elapsed, 1e-9)),
+            'raw_words_per_sec': int(raw_words / max(elapsed, 1e-9))
+        }
+        self.train_list.append(train_dict)
+        logging.info('word2vec train call: ' + str(self.num_train_calls) + ', epochs: ' + str(self.train_epochs) +
+                     ', workers: ' + str(self.workers) + ', effective words: ' + str(train_dict['effective_words']) +
+                     ', effective words/sec: ' + str(train_dict['effective_words_per_sec']) +
+                     ', time: ' + str(train_dict['time']) + ' sec')
+
+    def save(self, path):
+        import json
+        with open(path, 'w') as f:
+            json.dump({'workers': self.workers, 'train': self.train_list, 'epoch': self.epoch_list}, f, indent=2)
 
 
 class TrainWord2Vec:
@@ -21,7 +426,8 @@ class TrainWord2Vec:
         epoch: number of epochs to train
 
     :return
-    1. save clean data using pickle in data/word2vec_input_data/
+    1. save clean data in data/word2vec_input_data/ - pre-tokenized line corpus (<n>_corpus.txt) or raw reviews
+       (<n>.txt, review per line)
     2. save word2vec model (using gensim library) in data/wor2vec_pretrained/
 
     """
@@ -34,6 +440,8 @@ class TrainWord2Vec:
         self.output_results_folder = output_results_folder          # output folder to store word2vec parameters
         self.word2vec_parameters_dict = word2vec_parameters_dict    #
         self.verbose_flag = True
+        self.num_train_epochs = None                                # epochs of the last trained model
+        self.metrics_callback = None                                # EpochMetricsCallback of the last trained model
 
         from time import gmtime, strftime
         self.cur_time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
@@ -67,137 +475,475 @@ class TrainWord2Vec:
         logging.info("")
         return
 
-    def check_input(self):
-        if self.word2vec_parameters_dict['embedding_size'] not in [50, 100, 200, 300]:
-            raise ValueError('unknown word2vec embedding size: ' + str(self.word2vec_parameters_dict['embedding_size']))
+    def check_input(self, word2vec_sweep_dict=None):
+        embedding_size_list = [self.word2vec_parameters_dict['embedding_size']]
+        if word2vec_sweep_dict is not None:
+            embedding_size_list = word2vec_sweep_dict['embedding_size']
+        for embedding_size in embedding_size_list:
+            if embedding_size not in [50, 100, 200, 300]:
+                raise ValueError('unknown word2vec embedding size: ' + str(embedding_size))
+        # 'pickle' - older name of 'raw' (raw reviews data sets were a pickled list)
+        corpus_format = self.word2vec_parameters_dict.get('corpus_format', 'raw')
+        if corpus_format not in ['line_sentence', 'raw', 'pickle']:
+            raise ValueError('unknown corpus format: ' + str(corpus_format))
         pass
 
     # iterate over all configuration, build model for each
     def create_review_data_set(self):
         """
-        1. for each vertical
-        2. load all relevant reviews
-        3. create list of list
+        1. read every crawl csv once and route its reviews to the verticals (CRAWL_ROUTE_LIST) - reviews are
+           appended chunk by chunk to a file per route
+        2. for each vertical stream its route files (route list order) chunk by chunk
+        3. drop exact duplicate reviews (dedup_reviews - filter of the chunk stream)
+        4. write the data set to a temporary file, renamed when the amount of reviews is known -
+           line corpus (<n>_corpus.txt) or raw reviews (<n>.txt, review per line)
+        memory is bounded by the chunk size
         """
-        vertical_list = ['fashion', 'motors']
-        for vertical in vertical_list:
-            review_series = None
-            if vertical == 'fashion':
-
-                input_1 = '../data/word2vec_input_data/fashion/amazon-crawl-output.csv'
-                df_1 = pd.read_csv(input_1)
-                input_2 = '../data/word2vec_input_data/fashion/amazon-crawl-output-2.csv'
-                df_2 = pd.read_csv(input_2)
-
-                review_series_1 = df_1['REVIEWS']
-                review_series_2 = df_2['REVIEWS'][:343789]
-
-                print('review_series_1 shape: ' + str(review_series_1.shape))
-                print('review_series_2 shape: ' + str(review_series_2.shape))
-                review_series = review_series_1.append(review_series_2, ignore_index=True)
-                review_series = review_series
-                print('review_series total shape: ' + str(review_series.shape))
-
-            elif vertical == 'motors':
-
-                input_3 = '../data/word2vec_input_data/fashion/amazon-crawl-output-3.csv'
-                df_3 = pd.read_csv(input_3)
-                input_2 = '../data/word2vec_input_data/fashion/amazon-crawl-output-2.csv'
-                df_2 = pd.read_csv(input_2)
-
-                review_series_3 = df_3['REVIEWS']
-                review_series_2 = df_2['REVIEWS'][343790:]
-
-                print('review_series_3 shape: ' + str(review_series_3.shape))
-                print('review_series_2 shape: ' + str(review_series_2.shape))
-                review_series = review_series_3.append(review_series_2, ignore_index=True)
-                review_series = review_series
-                print('review_series total shape: ' + str(review_series.shape))
+        import json
+        import itertools
+
+        chunk_size = self.word2vec_parameters_dict.get('crawl_chunk_size', 200000)
+        output_dir = '../data/word2vec_input_data/'
+        route_file_dict, rejected_dict = route_crawl_csv(CRAWL_ROUTE_LIST, output_dir, chunk_size)
+
+        for vertical in ['fashion', 'motors']:
+            json_dir_name = output_dir + str(vertical) + '/'
+            review_chunks = iter_review_chunks(route_file_dict[vertical], chunk_size)
+
+            # drop exact duplicate reviews - every duplicate costs training time in every epoch
+            dedup_dict = None
+            if self.word2vec_parameters_dict.get('dedup_reviews', False):
+                dedup_dict = dict()
+                review_chunks = dedup_reviews(review_chunks, dedup_dict)
+            reviews = itertools.chain.from_iterable(review_chunks)
+
+            tmp_path = json_dir_name + 'data_set.tmp' + str(os.getpid())
+            if self.word2vec_parameters_dict.get('corpus_format', 'raw') == 'line_sentence':
+                num_reviews, num_tokens = write_line_sentence_corpus(
+                    reviews,
+                    tmp_path,
+                    workers=self._get_preprocess_workers(),
+                    chunk_size=self.word2vec_parameters_dict.get('preprocess_chunk_size', 10000))
+                data_set_path = json_dir_name + str(num_reviews) + '_corpus.txt'
+                print('save line sentence corpus to file: ' + str(data_set_path) + ', reviews: ' +
+                      str(num_reviews) + ', tokens: ' + str(num_tokens))
             else:
-                raise ValueError('unknown vertical')
-
-            review_series_list = self._prepare_date_to_word_2_vec(review_series)
-
-            json_dir_name = '../data/word2vec_input_data/' + str(vertical) + '/'
-            json_f_name = json_dir_name + str(len(review_series_list)) + '.txt'
-
-            import os
-            if not os.path.exists(json_dir_name):
-                os.makedirs(json_dir_name)
-
-            import pickle
-            with open(json_f_name, "wb") as fp:  # Pickling
-                pickle.dump(review_series_list, fp)
-            print('save json to file: ' + str(json_f_name))
-
-    def _prepare_date_to_word_2_vec(self, review_series):
-
-        review_series_list = list()
-        for i, v in review_series.items():
-
-            if i % 1000 == 0:
-                print('parse review number: ' + str(i))
-            try:
-                review_series[i] = review_series[i].replace("{", "")
-                review_series[i] = review_series[i].replace("}", "")
-                list_str = review_series[i].split('=')
-                review_series[i] = ''.join(list_str[1:])
-                review_series[i] = review_series[i][1:-1]
-                review_series_list.append(review_series[i])     # .decode('utf-8'))
-            except:
-                print('except review: ' + str(review_series[i]))
-
-        print('valid reviews: ' + str(len(review_series_list)))
-        return review_series_list
+                num_reviews = write_review_file(reviews, tmp_path)
+                data_set_path = json_dir_name + str(num_reviews) + '.txt'
+                print('save reviews to file: ' + str(data_set_path))
+            os.rename(tmp_path, data_set_path)
+
+            print('vertical: ' + str(vertical) + ', reviews: ' + str(num_reviews) +
+                  ', rejected reviews: ' + str(rejected_dict[vertical]))
+            if dedup_dict is not None:
+                print('vertical: ' + str(vertical) + ', dedup: ' + str(dedup_dict))
+                with open(get_dedup_path(data_set_path), 'w') as f:
+                    json.dump(dedup_dict, f, indent=2)
+
+            for route_path in route_file_dict[vertical]:
+                os.remove(route_path)
+
+    def _get_preprocess_workers(self):
+        """
+        processes used to parse and tokenize reviews, None - cores not used by the word2vec threads
+        parameters without the new keys (older configurations) keep the old behaviour - raw reviews corpus, one
+        tokenization process, no dedup, no corpus profile, 10 gensim threads
+        """
+        import multiprocessing
+        if multiprocessing.current_process().daemon:
+            return 1        # inside a pool worker (e.g. sweep run) - can not start child processes
+        if self.word2vec_parameters_dict.get('preprocess_workers', 1) is None:
+            return max(1, multiprocessing.cpu_count() - self.word2vec_parameters_dict.get('workers', 10))
+        return self.word2vec_parameters_dict.get('preprocess_workers', 1)
+
+    def _review_corpus(self, review_list, log_every=None):
+        """ ReviewCorpus of the raw reviews, temporary token file next to the input data """
+        token_dir = os.path.dirname(self.input_data_file) if self.input_data_file else None
+        return ReviewCorpus(review_list,
+                            log_every=log_every,
+                            workers=self._get_preprocess_workers(),
+                            chunk_size=self.word2vec_parameters_dict.get('preprocess_chunk_size', 10000),
+                            token_dir=token_dir or None)
 
     def create_word2vec(self):
-        review_series_list = self._load_data()
-        self.run_word2vec(review_series_list)
+        if self.word2vec_parameters_dict.get('corpus_format', 'raw') == 'line_sentence':
+            self.run_word2vec_corpus_file(self.input_data_file)
+        else:
+            review_series_list = self._load_data()
+            self.run_word2vec(review_series_list)
 
     def _load_data(self):
-        """ load list of str (review) using pickle"""
-        import pickle
+        """ load list of str (review) - raw reviews file (review per line), older data sets are a pickled list """
         with open(self.input_data_file, "rb") as fp:
-            review_series_list = pickle.load(fp)
-        return review_series_list
+            head = fp.read(5)
+            fp.seek(0)
+            if head.startswith(b'\x80') or head == b'(lp0\n':      # pickle protocol 2 / 0
+                import pickle
+                return pickle.load(fp)
+            return [_line_to_review(line) for line in fp]
 
     def run_word2vec(self, review_series):
         """
         run word2vec on vertical reviews
+        reviews are tokenized once to a temporary token file (ReviewCorpus), memory is bounded by the vocabulary
         """
 
-        logging.info('run word2vec for vertical: ' + str(vertical_type) + ', amount: ' + str(len(review_series)))
-        documents = list()
-        for i, line in enumerate(review_series):
-            if i % 1000 == 0:
-                print('pre-process line: ' + str(i))
+        logging.info('run word2vec for vertical: ' + str(self.vertical_type) + ', amount: ' + str(len(review_series)))
+        documents = self._review_corpus(review_series, log_every=100000)
+        try:
+            # review length histogram, vocabulary size and frequent tokens (one extra pass over the corpus)
+            if self.word2vec_parameters_dict.get('profile_corpus', False):
+                self._profile_corpus(documents)
+
+            print('')
+            print('start training word2vec model')
+
+            start_time = time.time()
+            model = self._train_model(documents)
+            self._log_dedup_time_saved(time.time() - start_time)
+        finally:
+            documents.close()
+        self._save_model(model, len(documents))
+        return
 
-            line = gensim.utils.simple_preprocess(line)
-            documents.append(line)
+    def run_word2vec_corpus_file(self, corpus_path):
+        """
+        run word2vec on a pre-tokenized line corpus (write_line_sentence_corpus)
+        gensim reads the file in its worker threads (corpus_file mode) - no python iterator, no GIL bottleneck
+        """
+        logging.info('run word2vec for vertical: ' + str(self.vertical_type) + ', corpus file: ' + str(corpus_path))
 
-        # to calculate histogram of review length please un-comment the function below
-        # self._build_histogram_review_length(documents)
+        # review length histogram, vocabulary size and frequent tokens (one extra pass over the corpus)
+        if self.word2vec_parameters_dict.get('profile_corpus', False):
+            self._profile_corpus(self._iter_corpus())
 
         print('')
         print('start training word2vec model')
 
-        # build vocabulary and train model
+        start_time = time.time()
+        model = self._train_model_corpus_file(corpus_path)
+        self._log_dedup_time_saved(time.time() - start_time)
+
+        # reviews = lines (model.corpus_count skips reviews without tokens), same k as the raw reviews corpus
+        with open(corpus_path, 'rb') as f:
+            num_reviews = sum(1 for _ in f)
+        self._save_model(model, num_reviews)
+        return
+
+    def run_word2vec_sweep(self, word2vec_sweep_dict):
+        """
+        train a model for every (embedding_size, window, epoch) combination
+        1. raw reviews are tokenized once to a line corpus next to them (<n>_corpus.txt), every combination trains
+           on it in corpus_file mode
+        2. corpus is scanned once, the vocabulary (word frequencies) is saved next to the corpus and reused
+        3. independent combinations run at the same time, each in its own process with 'workers' gensim threads,
+           number of running combinations is bounded by the core budget
+        """
+        import itertools
+        import multiprocessing
+
+        sweep_obj = self
+        if self.word2vec_parameters_dict.get('corpus_format', 'raw') != 'line_sentence':
+            sweep_obj = TrainWord2Vec(self._write_token_corpus(), self.vertical_type, self.output_results_folder,
+                                      dict(self.word2vec_parameters_dict, corpus_format='line_sentence'))
+        vocab_path = sweep_obj._build_vocab_file()
+
+        combination_list = list(itertools.product(word2vec_sweep_dict['embedding_size'],
+                                                  word2vec_sweep_dict['window'],
+                                                  word2vec_sweep_dict['epoch']))
+        core_budget = word2vec_sweep_dict['core_budget']
+        if core_budget is None:
+            core_budget = multiprocessing.cpu_count()
+        threads_per_run = max(1, min(self.word2vec_parameters_dict.get('workers', 10), core_budget))
+        parallel_runs = max(1, min(core_budget // threads_per_run, len(combination_list)))
+
+        logging.info('word2vec sweep: ' + str(len(combination_list)) + ' combinations, core budget: ' +
+                     str(core_budget) + ', parallel runs: ' + str(parallel_runs) + ', threads per run: ' +
+                     str(threads_per_run))
+
+        args_list = list()
+        for embedding_size, window, epoch in combination_list:
+            parameters_dict = dict(sweep_obj.word2vec_parameters_dict)
+            parameters_dict.update({
+                'embedding_size': embedding_size,
+                'window': window,
+                'epoch': epoch,
+                'workers': threads_per_run
+            })
+            args_list.append((sweep_obj.input_data_file, self.vertical_type, self.output_results_folder,
+                              parameters_dict, vocab_path))
+
+        start_time = time.time()
+        pool = multiprocessing.Pool(processes=parallel_runs, maxtasksperchild=1)
+        try:
+            for word2vec_path, run_time in pool.imap(_sweep_worker, args_list):
+                logging.info('sweep model: ' + str(word2vec_path) + ', time: ' + str(run_time) + ' sec')
+        finally:
+            pool.close()
+            pool.join()
+
+        logging.info('word2vec sweep total time: ' + str(round(time.time() - start_time, 3)) + ' sec')
+        return
+
+    def _write_token_corpus(self):
+        """
+        tokenize the raw reviews once to a line corpus next to them (<n>.txt -> <n>_corpus.txt, same format as the
+        'line_sentence' data set), rebuilt only when the raw reviews file is newer
+        :return: line corpus path
+        """
+        corpus_path = os.path.splitext(self.input_data_file)[0] + '_corpus.txt'
+        if os.path.exists(corpus_path) and os.path.getmtime(corpus_path) >= os.path.getmtime(self.input_data_file):
+            logging.info('load tokenized corpus: ' + str(corpus_path))
+            return corpus_path
+
+        start_time = time.time()
+        tmp_path = corpus_path + '.tmp' + str(os.getpid())
+        num_reviews, num_tokens = write_line_sentence_corpus(
+            self._load_data(),
+            tmp_path,
+            workers=self._get_preprocess_workers(),
+            chunk_size=self.word2vec_parameters_dict.get('preprocess_chunk_size', 10000))
+        os.rename(tmp_path, corpus_path)
+        _log_throughput('tokenize corpus ' + str(corpus_path), num_reviews, time.time() - start_time,
+                        self._get_preprocess_workers())
+        return corpus_path
+
+    def _build_vocab_file(self):
+        """
+        scan the corpus once - word frequencies, number of reviews and tokens
+        saved next to the corpus (<corpus>_vocab.pkl) and rebuilt only when the corpus file changed
+        :return: vocab file path
+        """
+        import pickle
+        from collections import Counter
+
+        vocab_path = os.path.splitext(self.input_data_file)[0] + '_vocab.pkl'
+        corpus_stat = os.stat(self.input_data_file)
+        corpus_key = (corpus_stat.st_size, int(corpus_stat.st_mtime))
+
+        if os.path.exists(vocab_path):
+            with open(vocab_path, 'rb') as f:
+                vocab_dict = pickle.load(f)
+            if vocab_dict['corpus_key'] == corpus_key:
+                logging.info('load vocabulary: ' + str(vocab_path) + ', words: ' + str(len(vocab_dict['word_freq'])))
+                return vocab_path
+
+        word_freq = Counter()
+        num_reviews = 0
+        for token_list in self._iter_corpus():
+            word_freq.update(token_list)
+            num_reviews += 1
+
+        vocab_dict = {
+            'corpus_key': corpus_key,
+            'word_freq': dict(word_freq),
+            'num_reviews': num_reviews,
+            'num_tokens': sum(word_freq.values())
+        }
+        with open(vocab_path, 'wb') as f:
+            pickle.dump(vocab_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        logging.info('save vocabulary: ' + str(vocab_path) + ', words: ' + str(len(word_freq)) + ', reviews: ' +
+                     str(num_reviews))
+        return vocab_path
+
+    def _iter_corpus(self):
+        """ token lists of the input corpus (line sentence file or raw reviews file) """
+        if self.word2vec_parameters_dict.get('corpus_format', 'raw') == 'line_sentence':
+            import io
+            with io.open(self.input_data_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield line.split()
+        else:
+            documents = self._review_corpus(self._load_data())
+            try:
+                for token_list in documents:
+                    yield token_list
+            finally:
+                documents.close()
+
+    def run_word2vec_from_vocab(self, vocab_path):
+        """
+        train a model on a vocabulary built by _build_vocab_file (no vocabulary scan of the corpus)
+        trained as in _train_model - the default gensim epochs (training inside the Word2Vec constructor) and then
+        'epoch' epochs
+        """
+        import pickle
+        with open(vocab_path, 'rb') as f:
+            vocab_dict = pickle.load(f)
+
         model = gensim.models.Word2Vec(
-            documents,
             size=self.word2vec_parameters_dict['embedding_size'],
             window=self.word2vec_parameters_dict['window'],
             min_count=1,
-            workers=10)
+            workers=self.word2vec_parameters_dict.get('workers', 10))
+        model.build_vocab_from_freq(vocab_dict['word_freq'], corpus_count=vocab_dict['num_reviews'])
+        model.corpus_total_words = vocab_dict['num_tokens']     # words/sec of the epoch metrics
+        metrics_callback = self._init_metrics_callback()
+
+        documents = None
+        if self.word2vec_parameters_dict.get('corpus_format', 'raw') != 'line_sentence':
+            documents = self._review_corpus(self._load_data())      # tokenized once, before the training threads
+        try:
+            for epochs in [model.epochs, self.word2vec_parameters_dict['epoch']]:
+                if documents is None:
+                    train_result = model.train(corpus_file=self.input_data_file,
+                                               total_examples=vocab_dict['num_reviews'],
+                                               total_words=vocab_dict['num_tokens'],
+                                               epochs=epochs,
+                                               compute_loss=True,
+                                               callbacks=[metrics_callback])
+                else:
+                    train_result = model.train(documents,
+                                               total_examples=vocab_dict['num_reviews'],
+                                               epochs=epochs,
+                                               compute_loss=True,
+                                               callbacks=[metrics_callback])
+                metrics_callback.add_train_summary(train_result)
+        finally:
+            if documents is not None:
+                documents.close()
+
+        return self._save_model(model, vocab_dict['num_reviews'])
+
+    def update_word2vec(self, update_word2vec_dict):
+        """
+        continue training an existing model on new reviews only (input_data_file = corpus of the new crawl batch)
+        1. vocabulary of the model is extended with the words of the new reviews
+        2. model is trained 'update_epoch' passes over the new reviews
+        3. model is saved as a new version next to the base model (<base model>_u_<version>) + vectors-only copy
+        """
+
+        base_model_path = update_word2vec_dict['base_model_path']
+        logging.info('update word2vec model: ' + str(base_model_path) + ', new reviews: ' + str(self.input_data_file))
+        model = gensim.models.Word2Vec.load(base_model_path)
+        base_vocab_size = len(model.wv.vocab)
+
+        if self.word2vec_parameters_dict.get('corpus_format', 'raw') == 'line_sentence':
+            documents = gensim.models.word2vec.LineSentence(self.input_data_file)
+        else:
+            documents = self._review_corpus(self._load_data())
+
+        try:
+            model.build_vocab(documents, update=True)
+            logging.info('vocabulary: ' + str(base_vocab_size) + ' -> ' + str(len(model.wv.vocab)) +
+                         ', new reviews: ' + str(model.corpus_count))
+
+            metrics_callback = self._init_metrics_callback()
+            train_result = model.train(documents,
+                                       total_examples=model.corpus_count,
+                                       epochs=update_word2vec_dict['update_epoch'],
+                                       compute_loss=True,
+                                       callbacks=[metrics_callback])
+            metrics_callback.add_train_summary(train_result)
+        finally:
+            if isinstance(documents, ReviewCorpus):
+                documents.close()
+
+        # next version of the root model (base model can be a version itself)
+        root_model_path = re.sub(r'_u_\d+$', '', base_model_path)
+        version = 1
+        while os.path.exists(root_model_path + '_u_' + str(version)):
+            version += 1
+        word2vec_path = root_model_path + '_u_' + str(version)
+
+        self._save_training_metrics(model, word2vec_path)
+        model.save(word2vec_path)
+        from embedding_store import save_vectors
+        save_vectors(word2vec_path, model.wv.index2word, model.wv.syn0)
 
-        model.train(documents,
-                    total_examples=model.corpus_count,
-                    # total_examples=len(documents),
-                    epochs=self.word2vec_parameters_dict['epoch'])
+        logging.info('save updated word2vec model: ' + str(word2vec_path))
+        return word2vec_path
 
-        word2vec_dir = self.output_results_folder + str(vertical_type) + '/'
+    def export_pruned_vectors(self, export_vectors_dict):
+        """
+        vectors-only copy of a trained model with the frequent words only (training uses min_count=1 - every typo of
+        the crawl has a vector). words are kept by frequency in the word2vec corpus: 'top_k' most frequent and/or
+        'min_count' floor (None - not used)
+        coverage of the labelled reviews (words as split by the classifier tokenizer) is reported before and after
+        saved as <model path>_top_<k>_min_<count> (+ .coverage.json), can be used as embedding_type['path']
+        """
+        import json
+        from embedding_store import save_vectors, prune_vectors, vocabulary_coverage, VECTORS_SUFFIX
+
+        model_path = export_vectors_dict['model_path']
+        top_k = export_vectors_dict['top_k']
+        min_count = export_vectors_dict['min_count']
+        if top_k is None and min_count is None:
+            raise ValueError('export vectors: top_k or min_count must be defined')
+
+        model = gensim.models.Word2Vec.load(model_path)
+        word_list = model.wv.index2word
+        word_count = [model.wv.vocab[word].count for word in word_list]
+        pruned_word_list, pruned_vectors = prune_vectors(word_list, model.wv.syn0, word_count, top_k, min_count)
+
+        labelled_word_count = self._load_labelled_word_counts(export_vectors_dict['labelled_data_file'])
+        coverage_before = vocabulary_coverage(labelled_word_count, model.wv.vocab)
+        coverage_after = vocabulary_coverage(labelled_word_count, set(pruned_word_list))
+
+        export_path = model_path + \
+            ('_top_' + str(top_k) if top_k is not None else '') + \
+            ('_min_' + str(min_count) if min_count is not None else '')
+        save_vectors(export_path, pruned_word_list, pruned_vectors)
+
+        report_dict = {
+            'model_path': model_path,
+            'labelled_data_file': export_vectors_dict['labelled_data_file'],
+            'top_k': top_k,
+            'min_count': min_count,
+            'words_before': len(word_list),
+            'words_after': len(pruned_word_list),
+            'vectors_mb_after': round(os.path.getsize(export_path + VECTORS_SUFFIX) / float(1024 ** 2), 3),
+            'coverage_before': coverage_before,
+            'coverage_after': coverage_after
+        }
+        with open(export_path + '.coverage.json', 'w') as f:
+            json.dump(report_dict, f, indent=2)
+
+        logging.info('export pruned vectors: ' + str(export_path) + ', words: ' + str(len(word_list)) + ' -> ' +
+                     str(len(pruned_word_list)) + ', vectors: ' + str(report_dict['vectors_mb_after']) + ' MB')
+        logging.info('labelled reviews coverage: words: ' + str(coverage_before['word_coverage']) + ' -> ' +
+                     str(coverage_after['word_coverage']) + ', tokens: ' + str(coverage_before['token_coverage']) +
+                     ' -> ' + str(coverage_after['token_coverage']))
+        return export_path
+
+    @staticmethod
+    def _load_labelled_word_counts(labelled_data_file):
+        """ Review column of a clean labelled csv (columnar copy if written from the current csv) -> word counts """
+        from columnar_store import get_store_dir, store_exists, load_columnar
+
+        store_dir = get_store_dir(labelled_data_file)
+        if store_exists(store_dir, labelled_data_file):
+            review_series = load_columnar(store_dir, ['Review'])['Review']
+        else:
+            review_series = pd.read_csv(labelled_data_file, usecols=['Review'])['Review']
+        return labelled_word_counts(review_series)
+
+    def _log_dedup_time_saved(self, train_time):
+        """ training time saved by the dedup of the data set - time per epoch * duplicate / unique tokens """
+        dedup_path = get_dedup_path(self.input_data_file)
+        if not os.path.exists(dedup_path):
+            return
+
+        import json
+        with open(dedup_path, 'r') as f:
+            dedup_dict = json.load(f)
+
+        epoch_time = train_time / float(self.num_train_epochs)
+        unique_tokens = max(dedup_dict['tokens'] - dedup_dict['duplicate_tokens'], 1)
+        saved_epoch_time = epoch_time * dedup_dict['duplicate_tokens'] / float(unique_tokens)
+        logging.info('dedup: duplicate reviews: ' + str(dedup_dict['duplicate_reviews']) + ' (ratio: ' +
+                     str(dedup_dict['dedup_ratio']) + '), epoch time: ' + str(round(epoch_time, 3)) +
+                     ' sec, estimated time saved per epoch: ' + str(round(saved_epoch_time, 3)) +
+                     ' sec, total: ' + str(round(saved_epoch_time * self.num_train_epochs, 3)) + ' sec')
+        return
+
+    def _save_model(self, model, num_reviews):
+
+        word2vec_dir = self.output_results_folder + str(self.vertical_type) + '/'
         word2vec_path = word2vec_dir + \
                         'd_' + str(self.word2vec_parameters_dict['embedding_size']) + \
-                        '_k_' + str(len(documents)) + \
+                        '_k_' + str(num_reviews) + \
                         '_w_' + str(self.word2vec_parameters_dict['window']) + \
                         '_e_' + str(self.word2vec_parameters_dict['epoch']) + \
                         '_v_' + str(self.vertical_type)
@@ -205,38 +951,165 @@ class TrainWord2Vec:
         if not os.path.exists(word2vec_dir):
             os.makedirs(word2vec_dir)
 
+        self._save_training_metrics(model, word2vec_path)
         model.save(word2vec_path)
 
+        # vectors-only copy (<path>.vectors.npy + <path>.vocab.pkl), classifier opens it memory-mapped
+        from embedding_store import save_vectors
+        save_vectors(word2vec_path, model.wv.index2word, model.wv.syn0)
+
         print('save word2vec model' + str(word2vec_path))
         print(model.wv.most_similar(positive='the', topn=6))
         print(model.wv.most_similar(positive='shirt', topn=6))
-        return
+        return word2vec_path
 
-    def _build_histogram_review_length(self, documents):
+    def _train_model(self, documents):
+        """
+        build vocabulary and train model
+        :param documents: iterable of token lists - must be restartable (list or ReviewCorpus)
+        """
+        model = gensim.models.Word2Vec(
+            documents,
+            size=self.word2vec_parameters_dict['embedding_size'],
+            window=self.word2vec_parameters_dict['window'],
+            min_count=1,
+            workers=self.word2vec_parameters_dict.get('workers', 10),
+            compute_loss=True,
+            callbacks=[self._init_metrics_callback()])
+        self.num_train_epochs = model.epochs + self.word2vec_parameters_dict['epoch']
+
+        train_result = model.train(documents,
+                                   total_examples=model.corpus_count,
+                                   # total_examples=len(documents),
+                                   epochs=self.word2vec_parameters_dict['epoch'],
+                                   compute_loss=True,
+                                   callbacks=[self.metrics_callback])
+        self.metrics_callback.add_train_summary(train_result)
+        return model
+
+    def _train_model_corpus_file(self, corpus_path):
+        """ build vocabulary and train model, same parameters as _train_model """
+        model = gensim.models.Word2Vec(
+            corpus_file=corpus_path,
+            size=self.word2vec_parameters_dict['embedding_size'],
+            window=self.word2vec_parameters_dict['window'],
+            min_count=1,
+            workers=self.word2vec_parameters_dict.get('workers', 10),
+            compute_loss=True,
+            callbacks=[self._init_metrics_callback()])
+        self.num_train_epochs = model.epochs + self.word2vec_parameters_dict['epoch']
+
+        train_result = model.train(corpus_file=corpus_path,
+                                   total_examples=model.corpus_count,
+                                   total_words=model.corpus_total_words,
+                                   epochs=self.word2vec_parameters_dict['epoch'],
+                                   compute_loss=True,
+                                   callbacks=[self.metrics_callback])
+        self.metrics_callback.add_train_summary(train_result)
+        return model
+
+    def _init_metrics_callback(self):
+        """ new epoch metrics callback of the model trained next (saved by _save_training_metrics) """
+        self.metrics_callback = EpochMetricsCallback(self.word2vec_parameters_dict.get('workers', 10))
+        return self.metrics_callback
+
+    def _save_training_metrics(self, model, word2vec_path):
+        """
+        training metrics next to the model (<path>.metrics.json)
+        callbacks are removed from the model before model.save - the model file does not depend on this module
+        """
+        model.callbacks = ()
+        if self.metrics_callback is None:
+            return
+        metrics_path = word2vec_path + '.metrics.json'
+        self.metrics_callback.save(metrics_path)
+        logging.info('save word2vec training metrics: ' + str(metrics_path))
+        return
 
-        import numpy as np
+    def _profile_corpus(self, documents, batch_tokens=1000000):
+        """
+        one pass over the corpus (iterable of token lists) in bounded memory
+            review length histogram + percentiles (exact, StreamingHistogram)
+            distinct tokens (HyperLogLog) - vocabulary size for min_count=1
+            heavy hitters (Count-Min + top-k candidates) - frequent tokens and their share of the corpus
+        save <n>_corpus_profile.json and <n>_histogram.png (review length clamped to 500)
+        """
+        import json
         import matplotlib.pyplot as plt
+        from sketches import StreamingHistogram, HyperLogLog, HeavyHitters, hash_tokens
+
+        top_k = self.word2vec_parameters_dict.get('profile_top_k', 1000)
+        length_histogram = StreamingHistogram()
+        distinct_tokens = HyperLogLog()
+        heavy_hitters = HeavyHitters(k=top_k)
+
+        length_list = list()
+        token_list_batch = list()
+        for token_list in documents:
+            length_list.append(len(token_list))
+            token_list_batch.extend(token_list)
+            if len(token_list_batch) >= batch_tokens:
+                self._update_corpus_sketches(length_histogram, distinct_tokens, heavy_hitters, length_list,
+                                             token_list_batch, hash_tokens)
+                length_list, token_list_batch = list(), list()
+        self._update_corpus_sketches(length_histogram, distinct_tokens, heavy_hitters, length_list,
+                                     token_list_batch, hash_tokens)
+
+        num_reviews = length_histogram.count
+        length_value, length_amount = length_histogram.nonzero_bins()
+        num_tokens = int((length_value * length_amount).sum())
+        percentile_list = [.05, .25, .5, .75, .95]
+        percentile_value_list = length_histogram.quantile(percentile_list)
+        top_list = heavy_hitters.top()
+
+        report_dict = {
+            'vertical': self.vertical_type,
+            'num_reviews': num_reviews,
+            'num_tokens': num_tokens,
+            'review_length_percentile': dict((str(q), float(value)) for q, value in
+                                             zip(percentile_list, percentile_value_list)),
+            'review_length_statistic': dict((key, float(value)) for key, value in
+                                            length_histogram.statistic().items()),
+            'distinct_tokens_approx': distinct_tokens.count(),
+            'top_tokens_coverage_approx': dict(
+                (str(k), round(sum(count for _, count in top_list[:k]) / float(max(num_tokens, 1)), 4))
+                for k in [10, 100, 1000, 10000] if k <= top_k),
+            'heavy_hitters_approx': [[token, count] for token, count in top_list]
+        }
+
+        for q, value in zip(percentile_list, percentile_value_list):
+            print(str(q) + ': ' + str(value))
+        logging.info('corpus profile: reviews: ' + str(num_reviews) + ', tokens: ' + str(num_tokens) +
+                     ', distinct tokens (approx): ' + str(report_dict['distinct_tokens_approx']))
+        logging.info('top tokens coverage (approx): ' + str(report_dict['top_tokens_coverage_approx']))
+
+        word2vec_dir = self.output_results_folder + str(self.vertical_type) + '/'
+        if not os.path.exists(word2vec_dir):
+            os.makedirs(word2vec_dir)
+        report_path = word2vec_dir + str(num_reviews) + '_corpus_profile.json'
+        with open(report_path, 'w') as f:
+            json.dump(report_dict, f, indent=2)
 
-        hist_list = [len(x) for x in documents]
-        a = np.array(hist_list)
-        print('0.05: ' + str(np.percentile(a, 5)))
-        print('q1: ' + str(np.percentile(a, 25)))
-        print('median: ' + str(np.percentile(a, 50)))
-        print('q3: ' + str(np.percentile(a, 75)))
-        print('0.95: ' + str(np.percentile(a, 95)))
-
-        for i, x in enumerate(hist_list):
-            if x > 500:
-                hist_list[i] = 500
-
-        plt.hist(hist_list, bins=100)
+        plt.hist(np.minimum(length_value, 500), bins=100, weights=length_amount)
         plt.title("Review length histogram")
         plt.xlabel("Review length")
         plt.ylabel("Amount")
-        # plt.show()
-        word2vec_dir = self.output_results_folder + str(vertical_type) + '/'
-        hist_path = word2vec_dir + str(len(documents)) + '_histogram.png'
+        hist_path = word2vec_dir + str(num_reviews) + '_histogram.png'
         plt.savefig(hist_path)
+        plt.close()
+
+        logging.info('save corpus profile: ' + str(report_path) + ', histogram: ' + str(hist_path))
+        return report_dict
+
+    @staticmethod
+    def _update_corpus_sketches(length_histogram, distinct_tokens, heavy_hitters, length_list, token_list,
+                                hash_tokens):
+        length_histogram.update(np.array(length_list, dtype=np.int64))
+        if token_list:
+            token_array = np.array(token_list, dtype=object)
+            hashes = hash_tokens(token_array)
+            distinct_tokens.update(hashes)
+            heavy_hitters.update(token_array, hashes)
 
     def _load_glove(self):
         """
@@ -245,26 +1118,29 @@ class TrainWord2Vec:
         """
 
         from gensim.scripts.glove2word2vec import glove2word2vec
+        from embedding_store import file_checksum
 
         GLOVE_DIR = '../data/golve_pretrained/glove.6B'
 
         glove_suffix_name = 'glove.6B.' + str(self.word2vec_parameters_dict['embedding_size']) + 'd.txt'
-        word2vec_suffix_name = 'glove.6B.' + str(self.word2vec_parameters_dict['embedding_size']) + 'd.txt.word2vec'
-
         glove_input_file = os.path.join(GLOVE_DIR, glove_suffix_name)
-        word2vec_output_file = os.path.join(GLOVE_DIR, word2vec_suffix_name)
 
-        # transform glove to word2vec
-        glove2word2vec(glove_input_file, word2vec_output_file)
+        # transform glove to word2vec - only if there is no converted file of this glove content (keyed by checksum)
+        word2vec_output_file = glove_input_file + '.' + file_checksum(glove_input_file)[:12] + '.word2vec'
+        if not os.path.exists(word2vec_output_file):
+            tmp_file = word2vec_output_file + '.tmp' + str(os.getpid())
+            glove2word2vec(glove_input_file, tmp_file)
+            os.rename(tmp_file, word2vec_output_file)
         return word2vec_output_file
 
 
-def main(input_data_file, vertical_type, output_results_folder, word2vec_parameters_dict, create_data_set, create_word_embedding):
+def main(input_data_file, vertical_type, output_results_folder, word2vec_parameters_dict, create_data_set, create_word_embedding,
+         word2vec_sweep_dict=None, update_word2vec_dict=None, export_vectors_dict=None):
 
     train_obj = TrainWord2Vec(input_data_file, vertical_type, output_results_folder, word2vec_parameters_dict)
 
     train_obj.init_debug_log()                  # init log file
-    train_obj.check_input()
+    train_obj.check_input(word2vec_sweep_dict)
 
     if create_data_set and create_word_embedding:
         raise ValueError('the two value cannot be true')
@@ -272,7 +1148,15 @@ def main(input_data_file, vertical_type, output_results_folder, word2vec_paramet
         train_obj.create_review_data_set()          # create review data set
 
     if create_word_embedding:
-        train_obj.create_word2vec()
+        if update_word2vec_dict is not None:
+            train_obj.update_word2vec(update_word2vec_dict)     # continue training on a new crawl batch
+        elif word2vec_sweep_dict is not None:
+            train_obj.run_word2vec_sweep(word2vec_sweep_dict)   # model per parameters combination
+        else:
+            train_obj.create_word2vec()
+
+    if export_vectors_dict is not None:
+        train_obj.export_pruned_vectors(export_vectors_dict)    # frequent words only, coverage of labelled reviews
     # train_obj.run_word2vec()
 
 
@@ -280,16 +1164,53 @@ if __name__ == '__main__':
 
     # input file name
     vertical_type = 'motors'                    # 'fashion'/'motors'
-    input_data_file = '../data/word2vec_input_data/motors/712904.txt'     # 1341062
-    # input_data_file = '../data/word2vec_input_data/fashion/1341062.txt'  # 1341062
+    input_data_file = '../data/word2vec_input_data/motors/712904_corpus.txt'     # 1341062
+    # input_data_file = '../data/word2vec_input_data/fashion/1341062_corpus.txt'  # 1341062
+    # input_data_file = '../data/word2vec_input_data/motors/712904.txt'  # raw reviews ('raw' corpus format)
 
     output_results_folder = '../data/word2vec_pretrained/'
     word2vec_parameters_dict = {
         'embedding_size': 100,
         'window': 10,
-        'epoch': 60
+        'epoch': 60,
+        'workers': 10,                      # gensim training threads
+        'corpus_format': 'line_sentence',   # 'line_sentence' - pre-tokenized file (corpus_file), 'raw' - raw reviews
+        'preprocess_workers': None,         # processes to parse/tokenize reviews, None - cpu_count() - workers
+        'preprocess_chunk_size': 10000,     # reviews per process pool task
+        'crawl_chunk_size': 200000,         # crawl csv rows per read (create data set)
+        'dedup_reviews': True,              # drop exact duplicate reviews (create data set)
+        'profile_corpus': True,             # json report + histogram of the corpus before training
+        'profile_top_k': 1000               # heavy hitters kept in the profile
     }
     create_data_set = False
     create_word_embedding = True
 
-    main(input_data_file, vertical_type, output_results_folder, word2vec_parameters_dict, create_data_set, create_word_embedding)
\ No newline at end of file
+    # sweep - model for every combination, vocabulary is built once (None - single model of word2vec_parameters_dict)
+    word2vec_sweep_dict = None
+    # word2vec_sweep_dict = {
+    #     'embedding_size': [100, 300],
+    #     'window': [6, 10],
+    #     'epoch': [60],
+    #     'core_budget': None             # cores for all parallel runs ('workers' threads each), None - all cores
+    # }
+
+    # update - extend an existing model with a new crawl batch (input_data_file = corpus of the new reviews only)
+    # saved as <base_model_path>_u_<version>, can be used as embedding_type['path'] in wrapper_train
+    update_word2vec_dict = None
+    # update_word2vec_dict = {
+    #     'base_model_path': '../data/word2vec_pretrained/motors/d_100_k_712904_w_10_e_60_v_motors',
+    #     'update_epoch': 5               # passes over the new reviews
+    # }
+
+    # export - vectors-only copy of a model with the frequent words only (None - no export)
+    # saved as <model_path>_top_<k>_min_<count>, can be used as embedding_type['path'] in wrapper_train
+    export_vectors_dict = None
+    # export_vectors_dict = {
+    #     'model_path': '../data/word2vec_pretrained/motors/d_100_k_712904_w_10_e_60_v_motors',
+    #     'top_k': 100000,                # most frequent words, None - no limit
+    #     'min_count': 5,                 # min frequency in the word2vec corpus, None - no floor
+    #     'labelled_data_file': '../data/clean/clean_data_multi_new_motors.csv'   # coverage report (Review column)
+    # }
+
+    main(input_data_file, vertical_type, output_results_folder, word2vec_parameters_dict, create_data_set, create_word_embedding,
+         word2vec_sweep_dict, update_word2vec_dict, export_vectors_dict)
\ No newline at end of file
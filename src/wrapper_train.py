@@ -84,6 +84,18 @@ class WrapperTrainModel:
         if 'type' not in embedding_type or 'path' not in embedding_type:
             raise ValueError('embedding type must contain path and type key')
 
+        index_mode = self.embedding_type.get('index_mode', 'fold')     # older configurations - 'fold'
+        if index_mode not in ['fold', 'pretrained']:
+            raise ValueError('unknown embedding index mode')
+
+        if index_mode == 'pretrained' and not self.embedding_pre_trained:
+            raise ValueError('pretrained index mode needs a pre-trained embedding')
+
+        # token ids of the pretrained mode are rows of the store (ordered by the word2vec vocabulary, not by the
+        # frequency in the data set) - limit the vocabulary with a pruned embedding (export_pruned_vectors) instead
+        if index_mode == 'pretrained' and self.lstm_parameters_dict['max_num_words'] is not None:
+            raise ValueError('max_num_words is not supported in pretrained index mode - use a pruned embedding')
+
         if self.lstm_parameters_dict['optimizer'] not in ['adam', 'rmsprop']:
             raise ValueError('unknown optimizer')
 
@@ -100,11 +112,19 @@ class WrapperTrainModel:
     # iterate over all configuration, build model for each
     def run_wrapper_model(self):
 
+        from sequence_cache import MAX_CACHE_MB, MAX_ENTRY_AGE_DAYS
+
         total_iteration = len(self.lstm_parameters_dict['maxlen'])\
                           * len(self.lstm_parameters_dict['batch_size'])\
                           * len(self.lstm_parameters_dict['lstm_hidden_layer'])\
                           * len(self.lstm_parameters_dict['dropout'])
 
+        # random folds (no cv seed) never repeat - cache entries would only fill the disk
+        sequence_cache_dir = self.lstm_parameters_dict.get('sequence_cache_dir')
+        if sequence_cache_dir is not None and self.cv_configuration.get('seed') is None:
+            logging.info('sequence cache is off - cv configuration has no seed (random folds)')
+            sequence_cache_dir = None
+
         model_num = 1
         for maxlen in self.lstm_parameters_dict['maxlen']:
             for batch_size in self.lstm_parameters_dict['batch_size']:
@@ -125,7 +145,13 @@ class WrapperTrainModel:
                                 'tensor_board_bool': self.lstm_parameters_dict['tensor_board_bool'],
                                 'max_num_words': self.lstm_parameters_dict['max_num_words'],
                                 'optimizer': self.lstm_parameters_dict['optimizer'],
-                                'patience': self.lstm_parameters_dict['patience']
+                                'patience': self.lstm_parameters_dict['patience'],
+                                'tokenizer_workers': self.lstm_parameters_dict.get('tokenizer_workers', 1),
+                                'sequence_cache_dir': sequence_cache_dir,
+                                'sequence_cache_max_mb': self.lstm_parameters_dict.get('sequence_cache_max_mb',
+                                                                                       MAX_CACHE_MB),
+                                'sequence_cache_max_age_days': self.lstm_parameters_dict.get(
+                                    'sequence_cache_max_age_days', MAX_ENTRY_AGE_DAYS)
                             }
 
                             logging.info('')
@@ -198,14 +224,17 @@ if __name__ == '__main__':
         'path': '../data/word2vec_pretrained/fashion/d_100_k_1341062_w_10_e_60_v_fashion',
         'd': 100,
         'w': 10,
-        'e': 60
+        'e': 60,
+        'index_mode': 'fold'    # 'fold' - tokenizer fit per fold, 'pretrained' - token id = row of the pre-trained matrix
         # 'path_dor': '../data/word2vec_amazon_pretrained/model.bin'
     }
     # fashion wv path = '../data/word2vec_pretrained/fashion/d_300_k_1341062_w_6_e_70_v_fashion'
 
     cv_configuration = {
         'use_cv_bool': True,
-        'num_fold': 5
+        'num_fold': 5,
+        'seed': 0,              # fold split seed - same folds for every configuration (sequence cache), None - random
+        'embedding_matrix_cache_size': None     # pre-trained embedding matrices kept per process, None - num_fold
     }
 
     # possible columns names:
@@ -248,7 +277,11 @@ if __name__ == '__main__':
         'optimizer': 'rmsprop',         # 'rmsprop'/'adam'
         'patience': 3,
         'tensor_board_bool': True,
-        'max_num_words': None           # number of words allow in the tokenizer process - keras text tokenizer
+        'max_num_words': None,          # number of words allow in the tokenizer process - keras text tokenizer
+        'tokenizer_workers': 4,         # processes to tokenize and pad reviews (used for large folds only)
+        'sequence_cache_dir': '../data/sequence_cache/',    # tokenized folds shared by configurations, None - off
+        'sequence_cache_max_mb': 10240,             # least recently used entries above are removed, None - no cap
+        'sequence_cache_max_age_days': 30           # entries not used for this long are removed, None - no cap
     }
 
     # quick hyper-parameters tuning